@@ -1,18 +1,25 @@
+import re
+import sys
+import json
+from collections import deque
 from utils import extract_prompt
 # from tools import *  # Consider removing if not used, or import specifics if needed elsewhere via base
 from inference import query_model
 # import random, string # These seem unused in base.py; consider removing.
 
 
+# Regular expression pattern to find JSON content between ```json and ```
+JSON_BLOCK_PATTERN = re.compile(r"```json(.*?)```", re.DOTALL)
+# Fallback: any JSON-like content in the output
+JSON_OBJECT_PATTERN = re.compile(r"\{.*?\}", re.DOTALL)
+CONTROL_CHAR_PATTERN = re.compile(r"[\x00-\x1F\x7F]")
+
+
 def extract_json_between_markers(llm_output):
-    # Regular expression pattern to find JSON content between ```json and ```
-    json_pattern = r"```json(.*?)```"
-    matches = re.findall(json_pattern, llm_output, re.DOTALL)
+    matches = JSON_BLOCK_PATTERN.findall(llm_output)
 
     if not matches:
-        # Fallback: Try to find any JSON-like content in the output
-        json_pattern = r"\{.*?\}"
-        matches = re.findall(json_pattern, llm_output, re.DOTALL)
+        matches = JSON_OBJECT_PATTERN.findall(llm_output)
 
     for json_string in matches:
         json_string = json_string.strip()
@@ -23,7 +30,7 @@ def extract_json_between_markers(llm_output):
             # Attempt to fix common JSON issues
             try:
                 # Remove invalid control characters
-                json_string_clean = re.sub(r"[\x00-\x1F\x7F]", "", json_string)
+                json_string_clean = CONTROL_CHAR_PATTERN.sub("", json_string)
                 parsed_json = json.loads(json_string_clean)
                 return parsed_json
             except json.JSONDecodeError:
@@ -33,13 +40,9 @@ def extract_json_between_markers(llm_output):
 
 
 
-def get_score(outlined_plan, latex, reward_model_llm, reviewer_type=None, attempts=3, openai_api_key=None):
-    e = str()
-    for _attempt in range(attempts):
-        try:
-            # todo: have a reward function here
-            # template inherited from the AI Scientist (good work on this prompt Sakana AI team :D)
-            template_instructions = """
+# review prompt used by get_score, built once at import
+# template inherited from the AI Scientist (good work on this prompt Sakana AI team :D)
+REVIEW_TEMPLATE_INSTRUCTIONS = """
             Respond in the following format:
 
             THOUGHT:
@@ -76,7 +79,7 @@ def get_score(outlined_plan, latex, reward_model_llm, reviewer_type=None, attemp
             For the "Decision" field, don't use Weak Accept, Borderline Accept, Borderline Reject, or Strong Reject. Instead, only use Accept or Reject.
             This JSON will be automatically parsed, so ensure the format is precise.
             """
-            neurips_form = ("""
+NEURIPS_REVIEW_FORM = ("""
                 ## Review Form
                 Below is a description of the questions you will be asked on the review form for each paper and some guidelines on what to consider when answering these questions.
                 When writing your review, please keep in mind that after decisions have been made, reviews and meta-reviews of accepted papers and opted-in rejected papers will be made public. 
@@ -133,47 +136,60 @@ def get_score(outlined_plan, latex, reward_model_llm, reviewer_type=None, attemp
                   1: Your assessment is an educated guess. The submission is not in your area or the submission was difficult to understand. Math/other details were not carefully checked.
 
                   You must make sure that all sections are properly created: abstract, introduction, methods, results, and discussion. Points must be reduced from your scores if any of these are missing.
-                """ + template_instructions)
+                """ + REVIEW_TEMPLATE_INSTRUCTIONS)
+
+
+# (review field, max rating, weight) for the fields that make up the review score
+REVIEW_SCORE_WEIGHTS = (
+    ("Soundness", 4, 0.1),
+    ("Presentation", 4, 0.2),
+    ("Confidence", 5, 0.1),
+    ("Contribution", 4, 0.4),
+    ("Overall", 10, 1.0),
+    ("Originality", 4, 0.1),
+    ("Significance", 4, 0.1),
+    ("Clarity", 4, 0.1),
+    ("Quality", 4, 0.1),
+)
+# max possible
+REVIEW_MAX_SCORE = sum(_weight for _, _, _weight in REVIEW_SCORE_WEIGHTS)
+
+
+def _review_performance(scoring):
+    """
+    Weighted review score on a 0-10 scale
+    @param scoring: (str) reviewer response containing the review JSON
+    @return: (float) performance, or None if the review cannot be parsed
+    """
+    review_json = extract_json_between_markers(scoring)
+    try:
+        return (sum(_weight * (int(review_json[_field]) / _max_rating)
+            for _field, _max_rating, _weight in REVIEW_SCORE_WEIGHTS) / REVIEW_MAX_SCORE) * 10
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def get_score(outlined_plan, latex, reward_model_llm, reviewer_type=None, attempts=3, openai_api_key=None):
+    e = str()
+    for _attempt in range(attempts):
+        try:
+            # todo: have a reward function here
             if reviewer_type is None: reviewer_type = ""
-            sys = (
+            system_prompt = (
                       "You are an AI researcher who is reviewing a paper that was submitted to a prestigious ML venue. "
                       f"Be critical and cautious in your decision. {reviewer_type}\n"
-                  ) + neurips_form
+                  ) + NEURIPS_REVIEW_FORM
             scoring = query_model(
                 model_str=f"{reward_model_llm}",
-                system_prompt=sys,
+                system_prompt=system_prompt,
                 openai_api_key=openai_api_key,
                 prompt=(
                     f"Outlined in the following text is the research plan that the machine learning engineer was tasked with building: {outlined_plan}\n\n"
-                    f"The following text is the research latex that the model produced: \n{latex}\n\n"), temp=0.0)
-            review_json = extract_json_between_markers(scoring)
-
-            overall = int(review_json["Overall"]) / 10
-            soundness = int(review_json["Soundness"]) / 4
-            confidence = int(review_json["Confidence"]) / 5
-            contribution = int(review_json["Contribution"]) / 4
-            presentation = int(review_json["Presentation"]) / 4
-            clarity = int(review_json["Clarity"]) / 4
-            originality = int(review_json["Originality"]) / 4
-            quality = int(review_json["Quality"]) / 4
-            significance = int(review_json["Significance"]) / 4
-
-            clarity_weight = 0.1
-            quality_weight = 0.1
-            overall_weight = 1.0
-            soundness_weight = 0.1
-            confidence_weight = 0.1
-            originality_weight = 0.1
-            significance_weight = 0.1
-            contribution_weight = 0.4
-            presentation_weight = 0.2
-
-            # max possible
-            max_score = (
-                clarity_weight + quality_weight + overall_weight + soundness_weight + confidence_weight + originality_weight + significance_weight + contribution_weight + presentation_weight)
-
-            performance = ((
-               soundness_weight * soundness + presentation_weight * presentation + confidence_weight * confidence + contribution_weight * contribution + overall_weight * overall + originality_weight * originality + significance * significance_weight + clarity_weight * clarity + quality_weight * quality) / max_score) * 10
+                    f"The following text is the research latex that the model produced: \n{latex}\n\n"), temp=0.0,
+                accept=lambda answer: _review_performance(answer) is not None)
+            performance = _review_performance(scoring)
+            if performance is None:
+                raise ValueError("The review could not be parsed into a score")
             return performance, f"The performance of your submission is: {performance}" + scoring, True
         except Exception as e:
             print(e)
@@ -182,6 +198,13 @@ def get_score(outlined_plan, latex, reward_model_llm, reviewer_type=None, attemp
 
 
 class BaseAgent:
+    __slots__ = (
+        "notes", "max_steps", "model", "phases", "plan", "report", "history", "prev_comm", "prev_report",
+        "exp_results", "dataset_code", "results_code", "lit_review_sum", "interpretation", "prev_exp_results",
+        "reviewer_response", "prev_results_code", "prev_interpretation", "openai_api_key", "second_round",
+        "max_hist_len", "_system_prompts",
+    )
+
     def __init__(self, model="gpt-4o-mini", notes=None, max_steps=100, openai_api_key=None):
         if notes is None: self.notes = []
         else: self.notes = notes
@@ -190,7 +213,7 @@ class BaseAgent:
         self.phases = []
         self.plan = str()
         self.report = str()
-        self.history = list()
+        self.history = deque()
         self.prev_comm = str()
         self.prev_report = str()
         self.exp_results = str()
@@ -206,6 +229,8 @@ class BaseAgent:
 
         self.second_round = False
         self.max_hist_len = 15
+        # phase -> system prompt, the role/phase/command text is constant per phase
+        self._system_prompts = dict()
 
     def set_model_backbone(self, model):
         self.model = model
@@ -224,8 +249,20 @@ class BaseAgent:
         model_resp = query_model(model_str=self.model, system_prompt=sys_prompt, prompt=query, temp=temp, openai_api_key=self.openai_api_key)
         return model_resp
 
+    def system_prompt(self, phase):
+        """
+        Build the system prompt for a phase, memoized since its parts do not change
+        @param phase: (str) current phase
+        @return: (str) system prompt
+        """
+        sys_prompt = self._system_prompts.get(phase)
+        if sys_prompt is None:
+            sys_prompt = sys.intern(f"""You are {self.role_description()} \nTask instructions: {self.phase_prompt(phase)}\n{self.command_descriptions(phase)}""")
+            self._system_prompts[phase] = sys_prompt
+        return sys_prompt
+
     def inference(self, research_topic, phase, step, feedback="", temp=None):
-        sys_prompt = f"""You are {self.role_description()} \nTask instructions: {self.phase_prompt(phase)}\n{self.command_descriptions(phase)}"""
+        sys_prompt = self.system_prompt(phase)
         context = self.context(phase)
         history_str = "\n".join([_[1] for _ in self.history])
         phase_notes = [_note for _note in self.notes if phase in _note["phases"]]
@@ -246,14 +283,15 @@ class BaseAgent:
             steps_exp = int(feedback.split("\n")[0].replace("```EXPIRATION ", ""))
             feedback = extract_prompt(feedback, "EXPIRATION")
         self.history.append((steps_exp, f"Step #{step}, Phase: {phase}, Feedback: {feedback}, Your response: {model_resp}"))
-        # remove histories that have expiration dates
-        for _i in reversed(range(len(self.history))):
-            if self.history[_i][0] is not None:
-                self.history[_i] = (self.history[_i][0] - 1, self.history[_i][1])
-                if self.history[_i][0] < 0:
-                    self.history.pop(_i)
+        # remove histories that have expiration dates, rotating through the deque keeps the order
+        for _ in range(len(self.history)):
+            exp, hist = self.history.popleft()
+            if exp is not None:
+                exp -= 1
+                if exp < 0: continue
+            self.history.append((exp, hist))
         if len(self.history) >= self.max_hist_len:
-            self.history.pop(0)
+            self.history.popleft()
         return model_resp
 
     def reset(self):
@@ -3,6 +3,8 @@ from inference import query_model
 
 
 class PhDStudentAgent(BaseAgent):
+    __slots__ = ("lit_review",)
+
     def __init__(self, model="gpt4omini", notes=None, max_steps=100, openai_api_key=None):
         super().__init__(model, notes, max_steps, openai_api_key)
         self.phases = [
@@ -56,7 +58,11 @@ class PhDStudentAgent(BaseAgent):
                 f"Current Interpretation of results: {self.interpretation}"
             )
         elif phase == "literature review":
-            return sr_str
+            # kept out of the system prompt so that it stays an identical, cacheable prefix
+            if len(self.lit_review) == 0: return sr_str
+            return (
+                sr_str,
+                "Papers in your review so far: " + " ".join([_paper["arxiv_id"] for _paper in self.lit_review]))
         else:
             return ""
 
@@ -121,8 +127,6 @@ class PhDStudentAgent(BaseAgent):
                 "Your goal is to perform a literature review for the presented task and add papers to the literature review.\n"
                 "You have access to arXiv and can perform two search operations: (1) finding many different paper summaries from a search query and (2) getting a single full paper text for an arXiv paper.\n"
             )
-            rev_papers = "Papers in your review so far: " + " ".join([_paper["arxiv_id"] for _paper in self.lit_review])
-            phase_str += rev_papers if len(self.lit_review) > 0 else ""
         elif phase == "plan formulation":
             phase_str = (
                 "You are a PhD student being directed by a postdoc who will help you come up with a good plan, and you interact with them through dialogue.\n"
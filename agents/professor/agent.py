@@ -3,6 +3,8 @@ from inference import query_model
 
 
 class ProfessorAgent(BaseAgent):
+    __slots__ = ()
+
     def __init__(self, model="gpt4omini", notes=None, max_steps=100, openai_api_key=None):
         super().__init__(model, notes, max_steps, openai_api_key)
         self.phases = ["report writing"]
@@ -1,7 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
 from ..base import get_score
 
 
 class ReviewersAgent:
+    __slots__ = ("notes", "model", "openai_api_key")
+
     def __init__(self, model="gpt-4o-mini", notes=None, openai_api_key=None):
         if notes is None: self.notes = []
         else: self.notes = notes
@@ -9,14 +12,16 @@ class ReviewersAgent:
         self.openai_api_key = openai_api_key
 
     def inference(self, plan, report):
-        reviewer_1 = "You are a harsh but fair reviewer and expect good experiments that lead to insights for the research topic."
-        review_1 = get_score(outlined_plan=plan, latex=report, reward_model_llm=self.model, reviewer_type=reviewer_1, openai_api_key=self.openai_api_key)
-
-        reviewer_2 = "You are a harsh and critical but fair reviewer who is looking for an idea that would be impactful in the field."
-        review_2 = get_score(outlined_plan=plan, latex=report, reward_model_llm=self.model, reviewer_type=reviewer_2, openai_api_key=self.openai_api_key)
-
-        reviewer_3 = "You are a harsh but fair open-minded reviewer that is looking for novel ideas that have not been proposed before."
-        review_3 = get_score(outlined_plan=plan, latex=report, reward_model_llm=self.model, reviewer_type=reviewer_3, openai_api_key=self.openai_api_key)
+        reviewers = [
+            "You are a harsh but fair reviewer and expect good experiments that lead to insights for the research topic.",
+            "You are a harsh and critical but fair reviewer who is looking for an idea that would be impactful in the field.",
+            "You are a harsh but fair open-minded reviewer that is looking for novel ideas that have not been proposed before.",
+        ]
+        # the reviews are independent of each other, so issue them concurrently
+        with ThreadPoolExecutor(max_workers=len(reviewers)) as executor:
+            review_1, review_2, review_3 = executor.map(
+                lambda reviewer: get_score(outlined_plan=plan, latex=report, reward_model_llm=self.model, reviewer_type=reviewer, openai_api_key=self.openai_api_key),
+                reviewers)
 
         return f"Reviewer #1:\n{review_1}, \nReviewer #2:\n{review_2}, \nReviewer #3:\n{review_3}"
 
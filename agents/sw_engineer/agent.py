@@ -2,6 +2,8 @@ from ..base import BaseAgent
 
 
 class SWEngineerAgent(BaseAgent):
+    __slots__ = ()
+
     def __init__(self, model="gpt4omini", notes=None, max_steps=100, openai_api_key=None):
         super().__init__(model, notes, max_steps, openai_api_key)
         self.phases = [
@@ -1,5 +1,6 @@
 import os
 import time
+from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from .main import (
@@ -123,36 +124,35 @@ def main():
             raise Exception("PDF compilation must be used with agentRxiv!")
 
         def run_lab(parallel_lab_index: int):
-            time_str = ""
             time_now = time.time()
-            for _paper_index in range(num_papers_to_write):
-                lab_dir = os.path.join(RESEARCH_DIR_PATH, f"research_dir_lab{parallel_lab_index}_paper{_paper_index}")
-                os.mkdir(lab_dir)
-                os.mkdir(os.path.join(lab_dir, "src"))
-                os.mkdir(os.path.join(lab_dir, "tex"))
-                lab_instance = LaboratoryWorkflow(
-                    parallelized=True,
-                    research_topic=research_topic,
-                    notes=task_notes_LLM,
-                    agent_model_backbone=agent_models,
-                    human_in_loop_flag=human_in_loop,
-                    openai_api_key=api_key,
-                    compile_pdf=compile_pdf,
-                    num_papers_lit_review=num_papers_lit_review,
-                    papersolver_max_steps=papersolver_max_steps,
-                    mlesolver_max_steps=mlesolver_max_steps,
-                    paper_index=_paper_index,
-                    lab_index=parallel_lab_index,
-                    except_if_fail=except_if_fail,
-                    lab_dir=lab_dir,
-                    agentRxiv=True,
-                    agentrxiv_papers=args.agentrxiv_papers,
-                )
-                lab_instance.perform_research()
-                time_str += str(time.time() - time_now) + " | "
-                with open(f"agent_times_{parallel_lab_index}.txt", "w") as f:
-                    f.write(time_str)
-                time_now = time.time()
+            with open(f"agent_times_{parallel_lab_index}.txt", "w") as time_file:
+                for _paper_index in range(num_papers_to_write):
+                    lab_dir = os.path.join(RESEARCH_DIR_PATH, f"research_dir_lab{parallel_lab_index}_paper{_paper_index}")
+                    Path(lab_dir, "src").mkdir(parents=True)
+                    Path(lab_dir, "tex").mkdir()
+                    lab_instance = LaboratoryWorkflow(
+                        parallelized=True,
+                        research_topic=research_topic,
+                        notes=task_notes_LLM,
+                        agent_model_backbone=agent_models,
+                        human_in_loop_flag=human_in_loop,
+                        openai_api_key=api_key,
+                        compile_pdf=compile_pdf,
+                        num_papers_lit_review=num_papers_lit_review,
+                        papersolver_max_steps=papersolver_max_steps,
+                        mlesolver_max_steps=mlesolver_max_steps,
+                        paper_index=_paper_index,
+                        lab_index=parallel_lab_index,
+                        except_if_fail=except_if_fail,
+                        lab_dir=lab_dir,
+                        agentRxiv=True,
+                        agentrxiv_papers=args.agentrxiv_papers,
+                    )
+                    lab_instance.perform_research()
+                    # append to the open file instead of rewriting the whole log for every paper
+                    time_file.write(str(time.time() - time_now) + " | ")
+                    time_file.flush()
+                    time_now = time.time()
 
         with ThreadPoolExecutor(max_workers=num_parallel_labs) as executor:
             futures = [executor.submit(run_lab, lab_idx) for lab_idx in range(num_parallel_labs)]
@@ -170,36 +170,34 @@ def main():
         if not agentRxiv:
             remove_directory(f"{RESEARCH_DIR_PATH}")
             os.mkdir(os.path.join(".", f"{RESEARCH_DIR_PATH}"))
-        if not os.path.exists("state_saves"):
-            os.mkdir(os.path.join(".", "state_saves"))
-        time_str = ""
+        Path("state_saves").mkdir(exist_ok=True)
         time_now = time.time()
-        for _paper_index in range(num_papers_to_write):
-            lab_direct = f"{RESEARCH_DIR_PATH}/research_dir_{_paper_index}_lab_{lab_index}"
-            os.mkdir(os.path.join(".", lab_direct))
-            os.mkdir(os.path.join(f"./{lab_direct}", "src"))
-            os.mkdir(os.path.join(f"./{lab_direct}", "tex"))
-            lab = LaboratoryWorkflow(
-                research_topic=research_topic,
-                notes=task_notes_LLM,
-                agent_model_backbone=agent_models,
-                human_in_loop_flag=human_in_loop,
-                openai_api_key=api_key,
-                compile_pdf=compile_pdf,
-                num_papers_lit_review=num_papers_lit_review,
-                papersolver_max_steps=papersolver_max_steps,
-                mlesolver_max_steps=mlesolver_max_steps,
-                paper_index=_paper_index,
-                except_if_fail=except_if_fail,
-                agentRxiv=False,
-                lab_index=lab_index,
-                lab_dir=f"./{lab_direct}",
-            )
-            lab.perform_research()
-            time_str += str(time.time() - time_now) + " | "
-            with open(f"agent_times_{lab_index}.txt", "w") as f:
-                f.write(time_str)
-            time_now = time.time()
+        with open(f"agent_times_{lab_index}.txt", "w") as time_file:
+            for _paper_index in range(num_papers_to_write):
+                lab_direct = f"{RESEARCH_DIR_PATH}/research_dir_{_paper_index}_lab_{lab_index}"
+                Path(lab_direct, "src").mkdir(parents=True)
+                Path(lab_direct, "tex").mkdir()
+                lab = LaboratoryWorkflow(
+                    research_topic=research_topic,
+                    notes=task_notes_LLM,
+                    agent_model_backbone=agent_models,
+                    human_in_loop_flag=human_in_loop,
+                    openai_api_key=api_key,
+                    compile_pdf=compile_pdf,
+                    num_papers_lit_review=num_papers_lit_review,
+                    papersolver_max_steps=papersolver_max_steps,
+                    mlesolver_max_steps=mlesolver_max_steps,
+                    paper_index=_paper_index,
+                    except_if_fail=except_if_fail,
+                    agentRxiv=False,
+                    lab_index=lab_index,
+                    lab_dir=f"./{lab_direct}",
+                )
+                lab.perform_research()
+                # append to the open file instead of rewriting the whole log for every paper
+                time_file.write(str(time.time() - time_now) + " | ")
+                time_file.flush()
+                time_now = time.time()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
+import io
 import PyPDF2
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from app import *
 from agents.professor import ProfessorAgent
 from agents.postdoc import PostdocAgent
@@ -7,12 +9,13 @@ from agents.phd_student import PhDStudentAgent
 from agents.ml_engineer import MLEngineerAgent
 from agents.sw_engineer import SWEngineerAgent
 from agents.reviewers import ReviewersAgent
-from tools.common import HFDataSearch, ArxivSearch, execute_code
+from tools.common import ArxivSearch, execute_code, get_hf_data_search
 from copy import copy
 from pathlib import Path
 from datetime import date
 from common_imports import *
 from mlesolver import MLESolver
+from papersolver import PaperSolver
 import argparse, pickle, yaml
 
 GLOBAL_AGENTRXIV = None
@@ -52,6 +55,7 @@ class LaboratoryWorkflow:
         self.review_ovrd_steps = 0 # review steps so far
         self.arxiv_paper_exp_time = 3
         self.reference_papers = list()
+        self.pending_review = None # (plan, report, model, future) of a review started ahead of report refinement
 
         ##########################################
         ####### COMPUTE BUDGET PARAMETERS ########
@@ -105,6 +109,12 @@ class LaboratoryWorkflow:
         self.sw_engineer = SWEngineerAgent(model=self.model_backbone, notes=self.notes, max_steps=self.max_steps, openai_api_key=self.openai_api_key)
 
 
+    def __getstate__(self):
+        # a review running in the background cannot be pickled, it is simply redone after a restore
+        state = self.__dict__.copy()
+        state["pending_review"] = None
+        return state
+
     def set_model(self, model):
         self.set_agent_attr("model", model)
         self.reviewers.model = model
@@ -116,7 +126,7 @@ class LaboratoryWorkflow:
         @return: None
         """
         with open(f"state_saves/Paper{self.paper_index}.pkl", "wb") as f:
-            pickle.dump(self, f)
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     def set_agent_attr(self, attr, obj):
         """
@@ -215,7 +225,15 @@ class LaboratoryWorkflow:
         Perform report refinement phase
         @return: (bool) whether to repeat the phase
         """
-        reviews = self.reviewers.inference(self.phd.plan, self.phd.report)
+        reviews = None
+        if self.pending_review is not None:
+            plan, report, model, future = self.pending_review
+            self.pending_review = None
+            # only reuse the early review if it was made for exactly this paper and reviewer model
+            if (plan, report, model) == (self.phd.plan, self.phd.report, self.reviewers.model):
+                reviews = future.result()
+        if reviews is None:
+            reviews = self.reviewers.inference(self.phd.plan, self.phd.report)
         print("Reviews:", reviews)
         if self.human_in_loop_flag["report refinement"]:
             print(f"Provided are reviews from a set of three reviewers: {reviews}")
@@ -243,6 +261,19 @@ class LaboratoryWorkflow:
                 return True
             else: raise Exception("Model did not respond")
 
+    def start_review(self):
+        """
+        Start reviewing the current report in the background, report refinement picks up the result
+        @return: None
+        """
+        model = self.phase_models.get("report refinement", DEFAULT_LLM_BACKBONE)
+        plan, report = self.phd.plan, self.phd.report
+        reviewers = ReviewersAgent(model=model, notes=self.notes, openai_api_key=self.openai_api_key)
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(reviewers.inference, plan, report)
+        executor.shutdown(wait=False)
+        self.pending_review = (plan, report, model, future)
+
     def report_writing(self):
         """
         Perform report writing phase
@@ -252,7 +283,6 @@ class LaboratoryWorkflow:
         report_notes = [_note["note"] for _note in self.ml_engineer.notes if "report writing" in _note["phases"]]
         report_notes = f"Notes for the task objective: {report_notes}\n" if len(report_notes) > 0 else ""
         # instantiate mle-solver
-        from papersolver import PaperSolver
         self.reference_papers = []
         solver = PaperSolver(notes=report_notes, max_steps=self.papersolver_max_steps, plan=self.phd.plan, exp_code=self.phd.results_code, exp_results=self.phd.exp_results, insights=self.phd.interpretation, lit_review=self.phd.lit_review, ref_papers=self.reference_papers, topic=research_topic, openai_api_key=self.openai_api_key, llm_str=self.model_backbone["report writing"], compile_pdf=compile_pdf, save_loc=self.lab_dir)
         # run initialization for solver
@@ -271,6 +301,9 @@ class LaboratoryWorkflow:
             retry = self.human_in_loop("report writing", report)
             if retry: return retry
         self.set_agent_attr("report", report)
+        # the reviews only need the plan and the final report, so start them now and
+        #  let them run while the readme is written
+        self.start_review()
         readme = self.professor.generate_readme()
         save_to_file(f"./{self.lab_dir}", "readme.md", readme)
         save_to_file(f"./{self.lab_dir}", "report.txt", report)
@@ -356,7 +389,6 @@ class LaboratoryWorkflow:
         ml_dialogue = str()
         swe_feedback = str()
         ml_command = str()
-        hf_engine = HFDataSearch()
         # iterate until max num tries to complete task is exhausted
         for _i in range(max_tries):
             print(f"@@ Lab #{self.lab_index} Paper #{self.paper_index} @@")
@@ -412,6 +444,8 @@ class LaboratoryWorkflow:
                 if self.verbose: print("!"*100, "\n", f"CODE RESPONSE: {code_resp}")
             if "```SEARCH_HF" in resp:
                 hf_query = extract_prompt(resp, "SEARCH_HF")
+                # built on the first search and shared by later phases and labs
+                hf_engine = get_hf_data_search()
                 hf_res = "\n".join(hf_engine.results_str(hf_engine.retrieve_ds(hf_query)))
                 ml_command = f"HF search command produced by the ML agent:\n{hf_query}"
                 ml_feedback += f"Huggingface results: {hf_res}\n"
@@ -485,10 +519,15 @@ class LaboratoryWorkflow:
             # grab summary of papers from arxiv
             if "```SUMMARY" in resp:
                 query = extract_prompt(resp, "SUMMARY")
-                papers = arx_eng.find_papers_by_str(query, N=self.arxiv_num_summaries)
-                if self.agentRxiv:
-                    if GLOBAL_AGENTRXIV.num_papers() > 0:
-                        papers += GLOBAL_AGENTRXIV.search_agentrxiv(query, self.num_agentrxiv_papers,)
+                if self.agentRxiv and GLOBAL_AGENTRXIV.num_papers() > 0:
+                    # the two searches hit independent services, so run them side by side
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        arxiv_future = executor.submit(arx_eng.find_papers_by_str, query, N=self.arxiv_num_summaries)
+                        agentrxiv_future = executor.submit(GLOBAL_AGENTRXIV.search_agentrxiv, query, self.num_agentrxiv_papers)
+                        papers = arxiv_future.result()
+                        papers += agentrxiv_future.result()
+                else:
+                    papers = arx_eng.find_papers_by_str(query, N=self.arxiv_num_summaries)
                 feedback = f"You requested arXiv papers related to the query {query}, here was the response\n{papers}"
 
             # grab full text from arxiv ID
@@ -580,9 +619,13 @@ class LaboratoryWorkflow:
         return False
 
 class AgentRxiv:
+    max_parallel_fetches = 4
+
     def __init__(self, lab_index=0):
         self.lab_index = lab_index
         self.server_thread = None
+        # keep-alive connection pool shared by the search call and the concurrent pdf downloads
+        self.session = requests.Session()
         self.initialize_server()
         self.pdf_text = dict()
         self.summaries = dict()
@@ -607,45 +650,56 @@ class AgentRxiv:
             return "Paper ID not found?"
 
     @staticmethod
-    def read_pdf_pypdf2(pdf_path):
-        with open(pdf_path, 'rb') as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
-            text = ''
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                text += page.extract_text()
-        return text
+    def read_pdf_pypdf2(pdf_file):
+        # pdf_file can be a path or a binary file object
+        reader = PyPDF2.PdfReader(pdf_file)
+        return "".join([page.extract_text() for page in reader.pages])
+
+    def summarize_paper(self, arxiv_id, pdf_url):
+        """
+        Download an AgentRxiv paper and summarize it
+        @param arxiv_id: (str) AgentRxiv paper id
+        @param pdf_url: (str) url of the paper pdf on the AgentRxiv server
+        @return: None
+        """
+        response = self.session.get(pdf_url)
+        response.raise_for_status()
+        # read from memory, a shared temporary file would be clobbered by concurrent downloads
+        self.pdf_text[arxiv_id] = self.read_pdf_pypdf2(io.BytesIO(response.content))
+        self.summaries[arxiv_id] = query_model(
+            prompt=self.pdf_text[arxiv_id],
+            system_prompt="Please provide a 5 sentence summary of this paper.",
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            model_str="gpt-4o-mini"
+        )
 
     def search_agentrxiv(self, search_query, num_papers):
         # Use the dynamic port here as well
-        url = f'http://127.0.0.1:{5000 + self.lab_index}/api/search?q={search_query}'
+        url = f'http://127.0.0.1:{5000 + self.lab_index}/api/search'
         return_str = str()
         try:
             with app.app_context():
                 update_papers_from_uploads()
-            response = requests.get(url)
+            response = self.session.get(url, params={'q': search_query, 'limit': num_papers})
             response.raise_for_status()
             data = response.json()
             return_str += "Search Query:" + data['query']
             return_str += "Results:"
-            for result in data['results'][:num_papers]:
+            results = data['results'][:num_papers]
+            # each new paper is a download plus an LLM summary, fetch them concurrently
+            new_papers = [(f"AgentRxiv:ID_{result['id']}", result['pdf_url']) for result in results
+                if f"AgentRxiv:ID_{result['id']}" not in self.summaries]
+            if new_papers:
+                with ThreadPoolExecutor(max_workers=min(len(new_papers), self.max_parallel_fetches)) as executor:
+                    list(executor.map(lambda paper: self.summarize_paper(*paper), new_papers))
+            # every AgentRxiv paper is dated today, format it once for the whole listing
+            formatted_date = date.today().strftime("%d/%m/%Y")
+            for result in results:
                 arxiv_id = f"AgentRxiv:ID_{result['id']}"
-                if arxiv_id not in self.summaries:
-                    filename = Path(f'_tmp_{self.lab_index}.pdf')
-                    response = requests.get(result['pdf_url'])
-                    filename.write_bytes(response.content)
-                    self.pdf_text[arxiv_id] = self.read_pdf_pypdf2(f'_tmp_{self.lab_index}.pdf')
-                    self.summaries[arxiv_id] = query_model(
-                        prompt=self.pdf_text[arxiv_id],
-                        system_prompt="Please provide a 5 sentence summary of this paper.",
-                        openai_api_key=os.getenv('OPENAI_API_KEY'),
-                        model_str="gpt-4o-mini"
-                    )
                 return_str += f"Title: {result['filename']}"
                 return_str += f"Summary: {self.summaries[arxiv_id]}\n"
-                formatted_date = date.today().strftime("%d/%m/%Y")
                 return_str += f"Publication Date: {formatted_date}\n"
-                return_str += f"arXiv paper ID: AgentRxiv:ID_{result['id']}"
+                return_str += f"arXiv paper ID: {arxiv_id}"
                 return_str += "-" * 40
         except Exception as e:
             print(f"AgentRxiv Error: {e}")
@@ -3,10 +3,10 @@ import random, time
 from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify
 from werkzeug.utils import secure_filename
 import os
+from pathlib import Path
 from PyPDF2 import PdfReader
 from flask_sqlalchemy import SQLAlchemy
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
 app = Flask(__name__)
@@ -14,6 +14,8 @@ app.config['SECRET_KEY'] = 'your-secret-key'
 app.config['UPLOAD_FOLDER'] = 'uploads/'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///papers.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# keep cached paper embeddings as int8 with a per-paper scale (set before the server starts)
+app.config['EMBEDDING_INT8'] = False
 
 db = SQLAlchemy(app)
 
@@ -28,19 +30,18 @@ def update_papers_from_uploads():
             uploads_dir = app.config['UPLOAD_FOLDER']
             file_list = os.listdir(uploads_dir)
             print("Files in uploads folder:", file_list)
+            # one query for the known filenames instead of one lookup per file in the folder
+            known_files = {filename for (filename,) in db.session.query(Paper.filename)}
             for filename in file_list:
                 if filename.lower().endswith('.pdf'):
                     # Check if file is already in the DB
-                    if not Paper.query.filter_by(filename=filename).first():
+                    if filename not in known_files:
                         print("Processing file:", filename)
                         file_path = os.path.join(uploads_dir, filename)
                         extracted_text = ""
                         try:
                             reader = PdfReader(file_path)
-                            for page in reader.pages:
-                                text = page.extract_text()
-                                if text:
-                                    extracted_text += text
+                            extracted_text = "".join([text for text in (page.extract_text() for page in reader.pages) if text])
                         except Exception as e:
                             flash(f'Error processing {filename}: {e}')
                             continue
@@ -61,6 +62,41 @@ def update_papers_from_uploads():
 # Load a pre-trained sentence transformer model
 model = SentenceTransformer('all-MiniLM-L6-v2')
 
+# paper id -> normalized embedding of the paper text, papers are only ever added
+# so each one is encoded once rather than on every search
+paper_embeddings = {}
+
+def quantize_int8(embedding):
+    """Symmetric int8 quantization of a vector, returns (values, scale)."""
+    scale = float(np.max(np.abs(embedding))) / 127.0 or 1.0
+    return np.round(embedding / scale).astype(np.int8), scale
+
+def rank_papers(query, limit=None):
+    """Return (paper, similarity) pairs for every paper with text (or the `limit` best), most similar first."""
+    papers = [paper for paper in Paper.query.all() if paper.text]
+    if not papers:
+        return []
+    use_int8 = app.config['EMBEDDING_INT8']
+    new_papers = [paper for paper in papers if paper.id not in paper_embeddings]
+    if new_papers:
+        new_embeddings = model.encode([paper.text for paper in new_papers], normalize_embeddings=True)
+        for paper, embedding in zip(new_papers, new_embeddings):
+            embedding = np.asarray(embedding, dtype=np.float32)
+            paper_embeddings[paper.id] = quantize_int8(embedding) if use_int8 else embedding
+    query_embedding = model.encode([query], normalize_embeddings=True)[0].astype(np.float32)
+    # rows are unit length, so the cosine similarity is a single matrix-vector product
+    if use_int8:
+        quantized = [paper_embeddings[paper.id] for paper in papers]
+        embeddings = np.stack([values for values, _ in quantized]).astype(np.int32)
+        scales = np.array([scale for _, scale in quantized], dtype=np.float32)
+        query_values, query_scale = quantize_int8(query_embedding)
+        similarities = (embeddings @ query_values.astype(np.int32)) * (scales * query_scale)
+    else:
+        embeddings = np.stack([paper_embeddings[paper.id] for paper in papers])
+        similarities = embeddings @ query_embedding
+    order = np.argsort(-similarities, kind='stable')[:limit]
+    return [(papers[i], similarities[i]) for i in order]
+
 @app.route('/update', methods=['GET'])
 def update_on_demand():
     update_papers_from_uploads()
@@ -89,10 +125,7 @@ def upload():
             extracted_text = ""
             try:
                 reader = PdfReader(file_path)
-                for page in reader.pages:
-                    text = page.extract_text()
-                    if text:
-                        extracted_text += text
+                extracted_text = "".join([text for text in (page.extract_text() for page in reader.pages) if text])
             except Exception as e:
                 flash(f'Error processing PDF: {e}')
             new_paper = Paper(filename=filename, text=extracted_text)
@@ -106,15 +139,7 @@ def upload():
 def search():
     query = request.args.get('q', '')
     if query:
-        papers = Paper.query.all()
-        query_embedding = model.encode([query])
-        paper_texts = [paper.text for paper in papers if paper.text]
-        if not paper_texts:
-            return render_template('search.html', papers=[], query=query)
-        paper_embeddings = model.encode(paper_texts)
-        similarities = cosine_similarity(query_embedding, paper_embeddings)[0]
-        papers_with_scores = list(zip([p for p in papers if p.text], similarities))
-        papers_sorted = sorted(papers_with_scores, key=lambda x: x[1], reverse=True)
+        papers_sorted = rank_papers(query)
         return render_template('search.html', papers=papers_sorted, query=query)
     return render_template('search.html', papers=[], query=query)
 
@@ -123,17 +148,11 @@ def api_search():
     query = request.args.get('q', '')
     if not query:
         return jsonify({'error': 'No query provided'}), 400
-    papers = Paper.query.all()
-    if not papers:
-        return jsonify({'query': query, 'results': []})
-    query_embedding = model.encode([query])
-    paper_texts = [paper.text for paper in papers if paper.text]
-    if not paper_texts:
-        return jsonify({'query': query, 'results': []})
-    paper_embeddings = model.encode(paper_texts)
-    similarities = cosine_similarity(query_embedding, paper_embeddings)[0]
-    papers_with_scores = list(zip([p for p in papers if p.text], similarities))
-    papers_sorted = sorted(papers_with_scores, key=lambda x: x[1], reverse=True)
+    # optional cap on the number of results, clients that only read the top few skip building the rest
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 0:
+        return jsonify({'error': 'limit must be non-negative'}), 400
+    papers_sorted = rank_papers(query, limit=limit)
     results = []
     for paper, score in papers_sorted:
         pdf_url = url_for('uploaded_file', filename=paper.filename, _external=True)
@@ -159,12 +178,11 @@ def view_pdf(paper_id):
 def run_app(port=5000):
     # Reset the database by removing the existing file
     db_path = "papers.db"
-    if os.path.exists("instance/" + db_path):
-        os.remove("instance/" + db_path)
+    Path("instance", db_path).unlink(missing_ok=True)
+    paper_embeddings.clear()
     with app.app_context():
         db.create_all()
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     app.run(debug=False, port=port)
 
 if __name__ == '__main__':
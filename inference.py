@@ -1,14 +1,175 @@
 import openai
-import time, tiktoken
+import time, tiktoken, threading, hashlib, functools, sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 import os, anthropic, json
 import google.generativeai as genai
 
 TOKENS_IN = dict()
 TOKENS_OUT = dict()
+# query_model may be called from several threads at once (e.g. the reviewers)
+TOKENS_LOCK = threading.Lock()
+
+# responses to deterministic (temp=0) queries, most recently used last
+RESPONSE_CACHE = OrderedDict()
+RESPONSE_CACHE_SIZE = 4096
+RESPONSE_CACHE_LOCK = threading.Lock()
+# optional sqlite file that keeps the cached responses across runs, e.g. when re-running a config
+RESPONSE_CACHE_DB = os.getenv("AGENTLAB_RESPONSE_CACHE")
+_response_db = None
 
 encoding = tiktoken.get_encoding("cl100k_base")
 
+def _response_cache_key(model_str, system_prompt, prompt):
+    digest = hashlib.blake2b(digest_size=16)
+    for _part in (model_str, system_prompt, prompt):
+        digest.update(_part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.digest()
+
+def _get_response_db():
+    # callers hold RESPONSE_CACHE_LOCK, which also serializes use of the connection
+    global _response_db
+    if _response_db is None:
+        _response_db = sqlite3.connect(RESPONSE_CACHE_DB, check_same_thread=False)
+        _response_db.execute("CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, answer TEXT NOT NULL)")
+        _response_db.commit()
+    return _response_db
+
+def _remember_response(key, answer):
+    RESPONSE_CACHE[key] = answer
+    RESPONSE_CACHE.move_to_end(key)
+    if len(RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+        RESPONSE_CACHE.popitem(last=False)
+
+def _get_cached_response(key):
+    with RESPONSE_CACHE_LOCK:
+        answer = RESPONSE_CACHE.get(key)
+        if answer is not None:
+            RESPONSE_CACHE.move_to_end(key)
+        elif RESPONSE_CACHE_DB:
+            row = _get_response_db().execute("SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                answer = row[0]
+                _remember_response(key, answer)
+        return answer
+
+def _cache_response(key, answer):
+    with RESPONSE_CACHE_LOCK:
+        _remember_response(key, answer)
+        if RESPONSE_CACHE_DB:
+            db = _get_response_db()
+            db.execute("INSERT OR REPLACE INTO responses (key, answer) VALUES (?, ?)", (key, answer))
+            db.commit()
+
+@functools.lru_cache(maxsize=None)
+def get_openai_client(api_key, base_url=None):
+    """
+    Shared OpenAI-compatible client per key and endpoint, so calls reuse its connection pool
+    @param api_key: (str) api key, None falls back to the environment
+    @param base_url: (str) endpoint of an OpenAI-compatible provider, None for OpenAI
+    @return: (OpenAI) client
+    """
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+@functools.lru_cache(maxsize=None)
+def get_anthropic_client(api_key):
+    """
+    Shared Anthropic client per key
+    @param api_key: (str) api key
+    @return: (anthropic.Anthropic) client
+    """
+    return anthropic.Anthropic(api_key=api_key)
+
+def _query_openai_chat(model_str, api_model, prompt, system_prompt, temp, version, gemini_api_key):
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}]
+    sampling = dict() if temp is None else {"temperature": temp}
+    if version == "0.28":
+        completion = openai.ChatCompletion.create(
+            model=f"{model_str}",  # engine = "deployment_name".
+            messages=messages, **sampling)
+    else:
+        client = get_openai_client(os.getenv("OPENAI_API_KEY"))
+        completion = client.chat.completions.create(
+            model=api_model, messages=messages, **sampling)
+    return completion.choices[0].message.content
+
+def _query_openai_reasoning(model_str, api_model, prompt, system_prompt, temp, version, gemini_api_key):
+    # reasoning models take neither a system role nor a temperature
+    messages = [
+        {"role": "user", "content": system_prompt + prompt}]
+    if version == "0.28":
+        completion = openai.ChatCompletion.create(
+            model=f"{model_str}",  # engine = "deployment_name".
+            messages=messages)
+    else:
+        client = get_openai_client(os.getenv("OPENAI_API_KEY"))
+        completion = client.chat.completions.create(
+            model=api_model, messages=messages)
+    return completion.choices[0].message.content
+
+def _query_deepseek(model_str, api_model, prompt, system_prompt, temp, version, gemini_api_key):
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}]
+    if version == "0.28":
+        raise Exception("Please upgrade your OpenAI version to use DeepSeek client")
+    sampling = dict() if temp is None else {"temperature": temp}
+    deepseek_client = get_openai_client(os.getenv('DEEPSEEK_API_KEY'), "https://api.deepseek.com/v1")
+    completion = deepseek_client.chat.completions.create(
+        model=api_model, messages=messages, **sampling)
+    return completion.choices[0].message.content
+
+def _query_gemini(model_str, api_model, prompt, system_prompt, temp, version, gemini_api_key):
+    genai.configure(api_key=gemini_api_key)
+    model = genai.GenerativeModel(model_name=api_model, system_instruction=system_prompt)
+    return model.generate_content(prompt).text
+
+def _query_claude(model_str, api_model, prompt, system_prompt, temp, version, gemini_api_key):
+    client = get_anthropic_client(os.environ["ANTHROPIC_API_KEY"])
+    # the system prompt is the static prefix of every agent call, mark it
+    #  as cacheable so repeated calls skip re-processing it
+    message = client.messages.create(
+        model=api_model,
+        system=[{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
+        messages=[{"role": "user", "content": prompt}],
+        extra_headers={"anthropic-beta": "prompt-caching-2024-07-31"})
+    return message.content[0].text
+
+# accepted spellings -> canonical model name
+MODEL_ALIASES = {
+    "gpt-4o-mini": "gpt-4o-mini",
+    "gpt4omini": "gpt-4o-mini",
+    "gpt-4omini": "gpt-4o-mini",
+    "gpt4o-mini": "gpt-4o-mini",
+    "gpt-4o": "gpt-4o",
+    "gpt4o": "gpt-4o",
+    "o1": "o1",
+    "o1-mini": "o1-mini",
+    "o1-preview": "o1-preview",
+    "o3-mini": "o3-mini",
+    "deepseek-chat": "deepseek-chat",
+    "claude-3.5-sonnet": "claude-3.5-sonnet",
+    "gemini-1.5-pro": "gemini-1.5-pro",
+    "gemini-2.0-pro": "gemini-2.0-pro",
+}
+# canonical model name -> (query function, provider model name)
+MODEL_DISPATCH = {
+    "gpt-4o-mini": (_query_openai_chat, "gpt-4o-mini-2024-07-18"),
+    "gpt-4o": (_query_openai_chat, "gpt-4o-2024-08-06"),
+    "o1": (_query_openai_reasoning, "o1-2024-12-17"),
+    "o1-mini": (_query_openai_reasoning, "o1-mini-2024-09-12"),
+    "o1-preview": (_query_openai_reasoning, "o1-preview"),
+    "o3-mini": (_query_openai_reasoning, "o3-mini-2025-01-31"),
+    "deepseek-chat": (_query_deepseek, "deepseek-chat"),
+    "claude-3.5-sonnet": (_query_claude, "claude-3-5-sonnet-latest"),
+    "gemini-1.5-pro": (_query_gemini, "gemini-1.5-pro"),
+    "gemini-2.0-pro": (_query_gemini, "gemini-2.0-pro-exp-02-05"),
+}
+
 def curr_cost_est():
     costmap_in = {
         "gpt-4o": 2.50 / 1000000,
@@ -32,7 +193,7 @@ def curr_cost_est():
     }
     return sum([costmap_in[_]*TOKENS_IN[_] for _ in TOKENS_IN]) + sum([costmap_out[_]*TOKENS_OUT[_] for _ in TOKENS_OUT])
 
-def query_model(model_str, prompt, system_prompt, openai_api_key=None, gemini_api_key=None,  anthropic_api_key=None, tries=5, timeout=5.0, temp=None, print_cost=True, version="1.5"):
+def query_model(model_str, prompt, system_prompt, openai_api_key=None, gemini_api_key=None,  anthropic_api_key=None, tries=5, timeout=5.0, temp=None, print_cost=True, version="1.5", use_cache=True, accept=None):
     preloaded_api = os.getenv('OPENAI_API_KEY')
     if openai_api_key is None and preloaded_api is not None:
         openai_api_key = preloaded_api
@@ -45,148 +206,21 @@ def query_model(model_str, prompt, system_prompt, openai_api_key=None, gemini_ap
         os.environ["ANTHROPIC_API_KEY"] = anthropic_api_key
     if gemini_api_key is not None:
         os.environ["GEMINI_API_KEY"] = gemini_api_key
+    if model_str not in MODEL_ALIASES:
+        # retrying cannot help an unknown model, fail before the first request
+        raise ValueError(f"Unsupported model {model_str}, choose from: {', '.join(MODEL_ALIASES)}")
+    model_str = MODEL_ALIASES[model_str]
+    query_fn, api_model = MODEL_DISPATCH[model_str]
+    # only greedy decoding is reproducible, sampled responses are never reused
+    cache_key = None
+    if use_cache and temp == 0.0:
+        cache_key = _response_cache_key(model_str, system_prompt, prompt)
+        answer = _get_cached_response(cache_key)
+        if answer is not None:
+            return answer
     for _ in range(tries):
         try:
-            if model_str == "gpt-4o-mini" or model_str == "gpt4omini" or model_str == "gpt-4omini" or model_str == "gpt4o-mini":
-                model_str = "gpt-4o-mini"
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}]
-                if version == "0.28":
-                    if temp is None:
-                        completion = openai.ChatCompletion.create(
-                            model=f"{model_str}",  # engine = "deployment_name".
-                            messages=messages
-                        )
-                    else:
-                        completion = openai.ChatCompletion.create(
-                            model=f"{model_str}",  # engine = "deployment_name".
-                            messages=messages, temperature=temp
-                        )
-                else:
-                    client = OpenAI()
-                    if temp is None:
-                        completion = client.chat.completions.create(
-                            model="gpt-4o-mini-2024-07-18", messages=messages, )
-                    else:
-                        completion = client.chat.completions.create(
-                            model="gpt-4o-mini-2024-07-18", messages=messages, temperature=temp)
-                answer = completion.choices[0].message.content
-
-            elif model_str == "gemini-2.0-pro":
-                genai.configure(api_key=gemini_api_key)
-                model = genai.GenerativeModel(model_name="gemini-2.0-pro-exp-02-05", system_instruction=system_prompt)
-                answer = model.generate_content(prompt).text
-            elif model_str == "gemini-1.5-pro":
-                genai.configure(api_key=gemini_api_key)
-                model = genai.GenerativeModel(model_name="gemini-1.5-pro", system_instruction=system_prompt)
-                answer = model.generate_content(prompt).text
-            elif model_str == "o3-mini":
-                model_str = "o3-mini"
-                messages = [
-                    {"role": "user", "content": system_prompt + prompt}]
-                if version == "0.28":
-                    completion = openai.ChatCompletion.create(
-                        model=f"{model_str}",  messages=messages)
-                else:
-                    client = OpenAI()
-                    completion = client.chat.completions.create(
-                        model="o3-mini-2025-01-31", messages=messages)
-                answer = completion.choices[0].message.content
-
-            elif model_str == "claude-3.5-sonnet":
-                client = anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
-                message = client.messages.create(
-                    model="claude-3-5-sonnet-latest",
-                    system=system_prompt,
-                    messages=[{"role": "user", "content": prompt}])
-                answer = json.loads(message.to_json())["content"][0]["text"]
-            elif model_str == "gpt4o" or model_str == "gpt-4o":
-                model_str = "gpt-4o"
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}]
-                if version == "0.28":
-                    if temp is None:
-                        completion = openai.ChatCompletion.create(
-                            model=f"{model_str}",  # engine = "deployment_name".
-                            messages=messages
-                        )
-                    else:
-                        completion = openai.ChatCompletion.create(
-                            model=f"{model_str}",  # engine = "deployment_name".
-                            messages=messages, temperature=temp)
-                else:
-                    client = OpenAI()
-                    if temp is None:
-                        completion = client.chat.completions.create(
-                            model="gpt-4o-2024-08-06", messages=messages, )
-                    else:
-                        completion = client.chat.completions.create(
-                            model="gpt-4o-2024-08-06", messages=messages, temperature=temp)
-                answer = completion.choices[0].message.content
-            elif model_str == "deepseek-chat":
-                model_str = "deepseek-chat"
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}]
-                if version == "0.28":
-                    raise Exception("Please upgrade your OpenAI version to use DeepSeek client")
-                else:
-                    deepseek_client = OpenAI(
-                        api_key=os.getenv('DEEPSEEK_API_KEY'),
-                        base_url="https://api.deepseek.com/v1"
-                    )
-                    if temp is None:
-                        completion = deepseek_client.chat.completions.create(
-                            model="deepseek-chat",
-                            messages=messages)
-                    else:
-                        completion = deepseek_client.chat.completions.create(
-                            model="deepseek-chat",
-                            messages=messages,
-                            temperature=temp)
-                answer = completion.choices[0].message.content
-            elif model_str == "o1-mini":
-                model_str = "o1-mini"
-                messages = [
-                    {"role": "user", "content": system_prompt + prompt}]
-                if version == "0.28":
-                    completion = openai.ChatCompletion.create(
-                        model=f"{model_str}",  # engine = "deployment_name".
-                        messages=messages)
-                else:
-                    client = OpenAI()
-                    completion = client.chat.completions.create(
-                        model="o1-mini-2024-09-12", messages=messages)
-                answer = completion.choices[0].message.content
-            elif model_str == "o1":
-                model_str = "o1"
-                messages = [
-                    {"role": "user", "content": system_prompt + prompt}]
-                if version == "0.28":
-                    completion = openai.ChatCompletion.create(
-                        model="o1-2024-12-17",  # engine = "deployment_name".
-                        messages=messages)
-                else:
-                    client = OpenAI()
-                    completion = client.chat.completions.create(
-                        model="o1-2024-12-17", messages=messages)
-                answer = completion.choices[0].message.content
-            elif model_str == "o1-preview":
-                model_str = "o1-preview"
-                messages = [
-                    {"role": "user", "content": system_prompt + prompt}]
-                if version == "0.28":
-                    completion = openai.ChatCompletion.create(
-                        model=f"{model_str}",  # engine = "deployment_name".
-                        messages=messages)
-                else:
-                    client = OpenAI()
-                    completion = client.chat.completions.create(
-                        model="o1-preview", messages=messages)
-                answer = completion.choices[0].message.content
-
+            answer = query_fn(model_str, api_model, prompt, system_prompt, temp, version, gemini_api_key)
             try:
                 if model_str in ["o1-preview", "o1-mini", "claude-3.5-sonnet", "o1", "o3-mini"]:
                     encoding = tiktoken.encoding_for_model("gpt-4o")
@@ -194,15 +228,21 @@ def query_model(model_str, prompt, system_prompt, openai_api_key=None, gemini_ap
                     encoding = tiktoken.encoding_for_model("cl100k_base")
                 else:
                     encoding = tiktoken.encoding_for_model(model_str)
-                if model_str not in TOKENS_IN:
-                    TOKENS_IN[model_str] = 0
-                    TOKENS_OUT[model_str] = 0
-                TOKENS_IN[model_str] += len(encoding.encode(system_prompt + prompt))
-                TOKENS_OUT[model_str] += len(encoding.encode(answer))
+                num_in = len(encoding.encode(system_prompt + prompt))
+                num_out = len(encoding.encode(answer))
+                with TOKENS_LOCK:
+                    if model_str not in TOKENS_IN:
+                        TOKENS_IN[model_str] = 0
+                        TOKENS_OUT[model_str] = 0
+                    TOKENS_IN[model_str] += num_in
+                    TOKENS_OUT[model_str] += num_out
                 if print_cost:
                     print(f"Current experiment cost = ${curr_cost_est()}, ** Approximate values, may not reflect true cost")
             except Exception as e:
                 if print_cost: print(f"Cost approximation has an error? {e}")
+            # an answer the caller cannot use must not be replayed to its retries
+            if cache_key is not None and (accept is None or accept(answer)):
+                _cache_response(cache_key, answer)
             return answer
         except Exception as e:
             print("Inference Exception:", e)
@@ -211,4 +251,21 @@ def query_model(model_str, prompt, system_prompt, openai_api_key=None, gemini_ap
     raise Exception("Max retries: timeout")
 
 
+def query_model_batch(model_str, prompts, system_prompts, max_workers=8, **kwargs):
+    """
+    Issue several independent queries concurrently
+    @param model_str: (str) model name
+    @param prompts: (list) user prompts
+    @param system_prompts: (list) system prompts, one per prompt
+    @param max_workers: (int) maximum number of requests in flight
+    @param kwargs: remaining query_model arguments, shared by all queries
+    @return: (list) answers in the order of the prompts
+    """
+    if not prompts: return list()
+    with ThreadPoolExecutor(max_workers=min(len(prompts), max_workers)) as executor:
+        return list(executor.map(
+            lambda prompt, system_prompt: query_model(model_str, prompt, system_prompt, **kwargs),
+            prompts, system_prompts))
+
+
 #print(query_model(model_str="o1-mini", prompt="hi", system_prompt="hey"))
\ No newline at end of file
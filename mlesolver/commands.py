@@ -1,3 +1,4 @@
+import re
 from abc import abstractmethod
 from tools.common import execute_code
 from utils import extract_prompt
@@ -55,6 +56,10 @@ class Replace(Command):
         return True, (new_code.split("\n"), code_ret)
 
 
+# ```EDIT N M\n<new lines>\n``` -> (N, M, new lines), matched in a single pass
+EDIT_COMMAND_PATTERN = re.compile(r"```EDIT\s+(\d+)[ \t]+(\d+)[ \t]*\n(.*?)```", re.DOTALL)
+
+
 class Edit(Command):
     def __init__(self):
         super().__init__()
@@ -69,23 +74,17 @@ class Edit(Command):
         )
 
     def execute_command(self, *args) -> str:
-        try:
-            args = args[0]
-            current_code = args[2]
-            lines_to_add = list(reversed(args[3]))
-            lines_to_replace = list(reversed(range(args[0], args[1] + 1)))
-            for _ln in lines_to_replace:
-                current_code.pop(_ln)
-            for _line in lines_to_add:
-                current_code.insert(args[0], _line)
-            new_code = "\n".join(current_code)
-            code_exec = f"{args[4]}\n{new_code}"
-            code_ret = execute_code(code_exec)
-            if "CODE EXECUTION ERROR" in code_ret:
-                return (False, None, code_ret)
-            return (True, current_code, code_ret)
-        except Exception as e:
-            return (False, None, str(e))
+        args = args[0]
+        current_code = args[2]
+        if not (0 <= args[0] <= args[1] < len(current_code)):
+            return (False, None, f"Invalid line range {args[0]}-{args[1]}, the current code has lines 0-{len(current_code) - 1}.")
+        current_code[args[0]:args[1] + 1] = args[3]
+        new_code = "\n".join(current_code)
+        code_exec = f"{args[4]}\n{new_code}"
+        code_ret = execute_code(code_exec)
+        if "CODE EXECUTION ERROR" in code_ret:
+            return (False, None, code_ret)
+        return (True, current_code, code_ret)
 
     def matches_command(self, cmd_str) -> bool:
         if "```EDIT" in cmd_str:
@@ -94,23 +93,16 @@ class Edit(Command):
 
     def parse_command(self, *args) -> tuple:
         cmd_str, codelines, datasetcode = args[0], args[1], args[2]
-        success = True
-        try:
-            text = extract_prompt(cmd_str, "EDIT").split("\n")
-            if len(text) == 0:
-                return False, None
-            lines_to_edit = text[0].split(" ")
-            if len(lines_to_edit) != 2:
-                return False, None
-            lines_to_edit = [int(_) for _ in lines_to_edit]
-            if len(text[1:]) == 0:
-                return False, None
-            return success, (
-                lines_to_edit[0],
-                lines_to_edit[1],
-                codelines,
-                text[1:],
-                datasetcode,
-            )
-        except Exception:
-            return False, (None, None, None, None, None)
+        match = EDIT_COMMAND_PATTERN.search(cmd_str)
+        if match is None:
+            return False, None
+        new_lines = match.group(3).rstrip()
+        if not new_lines:
+            return False, None
+        return True, (
+            int(match.group(1)),
+            int(match.group(2)),
+            codelines,
+            new_lines.split("\n"),
+            datasetcode,
+        )
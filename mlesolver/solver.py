@@ -1,5 +1,6 @@
 import random
 from copy import copy
+from collections import deque
 from common_imports import *
 from tools.common import execute_code
 from inference import query_model
@@ -21,13 +22,18 @@ class MLESolver:
         self.st_hist_len = 2
         self.min_gen_trials = 1
         self.code_lines = str()
-        self.st_history = list()
+        # only the last st_hist_len steps are shown to the model, older ones fall off the left
+        self.st_history = deque(maxlen=self.st_hist_len)
         self.insights = insights
         self.code_reflect = str()
         self.max_steps = max_steps
         self.prev_code_ret = str()
         self.should_execute_code = True
         self.openai_api_key = openai_api_key
+        # (command list, description) so the prompt text is only rebuilt when the commands are swapped
+        self._cmd_desc_cache = (None, str())
+        # static leading part of the system prompt, built on first use
+        self._prompt_prefix = None
 
     def initial_solve(self):
         """
@@ -98,7 +104,6 @@ class MLESolver:
             self.code_lines = copy(random.choice(self.best_codes)[0])
             cmd_str, code_lines, prev_code_ret, should_execute_code, score = self.process_command(model_resp)
             self.st_history.append([model_resp, prev_code_ret, code_lines, cmd_str])
-            if len(self.st_history) > self.st_hist_len: self.st_history.pop(0)
             if score is not None:
                 if top_score is None:
                     best_pkg = copy(code_lines), copy(prev_code_ret), copy(should_execute_code), copy(model_resp), copy(cmd_str)
@@ -161,7 +166,7 @@ class MLESolver:
                             cmd_return = cmd.execute_command(args)
                             code_err = f"Return from executing code: {cmd_return[2]}"
                             if cmd_return[0]:  # if success
-                                code_lines = copy(cmd_return[1])
+                                code_lines = cmd_return[1]
                                 score, cmd_str, is_valid = get_score(self.plan, "\n".join(code_lines), cmd_return[2], openai_api_key=self.openai_api_key, REWARD_MODEL_LLM=self.llm_str)
                                 if is_valid:
                                     failed = False
@@ -188,7 +193,7 @@ class MLESolver:
                         success, args = cmd.parse_command(model_resp, self.dataset_code)
                         code_err = f"Return from executing code: {args[1]}"
                         if success:
-                            code_lines = copy(args[0])
+                            code_lines = args[0]
                             score, cmd_str, is_valid = get_score(self.plan, "\n".join(code_lines), args[1], openai_api_key=self.openai_api_key, REWARD_MODEL_LLM=self.llm_str)
                             if is_valid:
                                 failed = False
@@ -203,7 +208,6 @@ class MLESolver:
                         if not self.supress_print: print("$$$$ CODE REPLACE (failed)")
                     else:
                         cmd_str = "Code was successfully replaced."
-                        code_lines = copy(args[0])
                         prev_code_ret = copy(args[1])
                         if not self.supress_print: print("$$$$ CODE REPLACE (success)")
                         should_execute_code = True
@@ -216,15 +220,16 @@ class MLESolver:
         Well-formatted history string
         @return: (str) history string
         """
-        hist_str = ""
-        for _hist in range(len(self.st_history)):
-            hist_str += f"-------- History ({len(self.st_history)-_hist} steps ago) -----\n"
-            hist_str += f"Because of the following response: {self.st_history[_hist][0]}\n" if len(self.st_history[_hist][0]) > 0 else ""
-            hist_str += f"and the following COMMAND response output: {self.st_history[_hist][3]}\n"
-            hist_str += f"With the following code used: {'#'*20}\n{self.st_history[_hist][2]}\n{'#'*20}\n\n"
-            hist_str += f"The environment feedback and reflection was as follows: {self.st_history[_hist][1]}\n"
-            hist_str += f"-------- End of history ({len(self.st_history)-_hist} steps ago) -------\n"
-        return hist_str
+        hist_str = list()
+        for _hist, _entry in enumerate(self.st_history):
+            steps_ago = len(self.st_history) - _hist
+            hist_str.append(f"-------- History ({steps_ago} steps ago) -----\n")
+            if len(_entry[0]) > 0: hist_str.append(f"Because of the following response: {_entry[0]}\n")
+            hist_str.append(f"and the following COMMAND response output: {_entry[3]}\n")
+            hist_str.append(f"With the following code used: {'#'*20}\n{_entry[2]}\n{'#'*20}\n\n")
+            hist_str.append(f"The environment feedback and reflection was as follows: {_entry[1]}\n")
+            hist_str.append(f"-------- End of history ({steps_ago} steps ago) -------\n")
+        return "".join(hist_str)
 
     def system_prompt(self, commands=True):
         """
@@ -232,6 +237,23 @@ class MLESolver:
         @param commands: (bool) whether to use command prompt
         @return: (str) system prompt
         """
+        # the part of the prompt that changes between steps goes last, so that the
+        #  long identical prefix can be served from the provider's prompt cache
+        if self._prompt_prefix is None:
+            self._prompt_prefix = self._static_system_prompt()
+        return (
+            self._prompt_prefix
+            # CODE INSIGHTS
+            + f"{self.code_reflect}"
+            # COMMAND SET
+            + (f"The following are commands you have access to: {self.command_descriptions()}\n. You should try to have a diversity of command responses if appropriate. Do not repeat the same commend too many times. Please consider looking through your history and not repeating commands too many times." if commands else "")
+        )
+
+    def _static_system_prompt(self):
+        """
+        Produce the part of the system prompt that stays fixed for the lifetime of the solver
+        @return: (str) static system prompt prefix
+        """
         return (
             # ROLE DESCRIPTION
             f"{self.role_description()}.\n"
@@ -239,13 +261,11 @@ class MLESolver:
             f"The following are your task instructions: {self.phase_prompt()}\n"
             # LIT REVIEW INSIGHTS
             f"Provided below are some insights from a literature review summary:\n{self.insights}\n"
-            # CODE INSIGHTS
-            f"{self.code_reflect}"
             # NOTES
             f"The following are notes, instructions, and general tips for you: {self.notes}"
             # PLAN DESCRIPTION
             f"You are given a machine learning research task described, where the plan is described as follows: {self.plan}\n"
-            # DATASET DESCRIPTION            
+            # DATASET DESCRIPTION
             f"{self.generate_dataset_descr_prompt()}"
             # Create Figures
             f"You should also try generating at least two figures to showcase the results, titled Figure_1.png and Figure_2.png\n"
@@ -253,8 +273,6 @@ class MLESolver:
             # transition
             f"Your goal is to solve the research plan as well as possible. You will receive a score after you write the code and should aim to maximize the score by following the plan instructions and writing high quality code.\n"
             f"Before each experiment please include a print statement explaining exactly what the results are meant to show in great detail before printing the results out.\n"
-            # COMMAND SET
-            f"The following are commands you have access to: {self.command_descriptions()}\n. You should try to have a diversity of command responses if appropriate. Do not repeat the same commend too many times. Please consider looking through your history and not repeating commands too many times." if commands else ""
         )
 
     def generate_code_lines(self, code):
@@ -263,10 +281,7 @@ class MLESolver:
         @param code: (list) list of code line strings
         @return: (str) code lines formatted with line numbers
         """
-        codestr = str()
-        for _index in range(len(code)):
-            codestr += f"{_index} |{code[_index]}\n"
-        return codestr
+        return "".join([f"{_index} |{_line}\n" for _index, _line in enumerate(code)])
 
     def feedback(self, code_return):
         """
@@ -288,7 +303,7 @@ class MLESolver:
 
                 for file in os.listdir("."):
                     if file.endswith(".csv"):
-                        os.system(f"rm {file}")
+                        os.remove(file)
             else:
                 if not self.supress_print: print("@@@@ No return")
                 reflect_prompt = f"This is your code: {code_str}\n\nYour code did not return an error, but also did not successfully submit a submission csv file. Please reflect on how you can improve your submission for the next cycle to submit a file and obtain a high score."
@@ -354,8 +369,12 @@ class MLESolver:
         Provide command descriptions
         @return: (str) command descriptions
         """
+        if self._cmd_desc_cache[0] is self.commands:
+            return self._cmd_desc_cache[1]
         cmd_strings = "\n".join([_cmd.docstring() for _cmd in self.commands])
-        return f"\nYou also have access to tools which can be interacted with using the following structure: ```COMMAND\n<command information here>\n```, where COMMAND is whichever command you want to run (e.g. EDIT, REPLACE...), <command information here> is information used for the command, such as code to run or a search query, and ``` are meant to encapsulate the command. ``` must be included as part of the command both at the beginning and at the end of the code. DO NOT FORGOT TO HAVE ``` AT THE TOP AND BOTTOM OF CODE. and this structure must be followed to execute a command correctly. YOU CAN ONLY EXECUTE A SINGLE COMMAND AT A TIME! Do not try to perform multiple commands EVER only one. {self._common_code_errors()}" + cmd_strings
+        cmd_desc = f"\nYou also have access to tools which can be interacted with using the following structure: ```COMMAND\n<command information here>\n```, where COMMAND is whichever command you want to run (e.g. EDIT, REPLACE...), <command information here> is information used for the command, such as code to run or a search query, and ``` are meant to encapsulate the command. ``` must be included as part of the command both at the beginning and at the end of the code. DO NOT FORGOT TO HAVE ``` AT THE TOP AND BOTTOM OF CODE. and this structure must be followed to execute a command correctly. YOU CAN ONLY EXECUTE A SINGLE COMMAND AT A TIME! Do not try to perform multiple commands EVER only one. {self._common_code_errors()}" + cmd_strings
+        self._cmd_desc_cache = (self.commands, cmd_desc)
+        return cmd_desc
 
     def run_code(self):
         """
@@ -1,3 +1,4 @@
+import re
 import random
 import string
 from utils import *
@@ -110,6 +111,10 @@ class PaperReplace(Command):
         if "[CODE EXECUTION ERROR]" in latex_ret: return False, (None, latex_ret,)
         return True, (new_latex.split("\n"), latex_ret)
 
+# ```EDIT N M\n<new lines>\n``` -> (N, M, new lines), matched in a single pass
+EDIT_COMMAND_PATTERN = re.compile(r"```EDIT\s+(\d+)[ \t]+(\d+)[ \t]*\n(.*?)```", re.DOTALL)
+
+
 class PaperEdit(Command):
     def __init__(self, save_loc):
         super().__init__()
@@ -129,22 +134,20 @@ class PaperEdit(Command):
         # args[1] -> M (int)
         # args[2] -> old latex
         # args[3] -> new lines to replace
+        args = args[0]
+        current_latex = args[2]
+        if not (0 <= args[0] <= args[1] < len(current_latex)):
+            return (False, None, f"Invalid line range {args[0]}-{args[1]}, the current latex has lines 0-{len(current_latex) - 1}.")
+        current_latex[args[0]:args[1]+1] = args[3]
+        new_latex = "\n".join(current_latex)
+        latex_exec = f"{new_latex}"
         try:
-            args = args[0]
-            current_latex = args[2]
-            lines_to_add = list(reversed(args[3]))
-            lines_to_replace = list(reversed(range(args[0], args[1]+1)))
-            for _ln in lines_to_replace:
-                current_latex.pop(_ln)
-            for _line in lines_to_add:
-                current_latex.insert(args[0], _line)
-            new_latex = "\n".join(current_latex)
-            latex_exec = f"{new_latex}"
             latex_ret = compile_latex(latex_exec, self.save_loc, compile=args[4])
-            if "error" in latex_ret.lower(): return (False, None, latex_ret)
-            return (True, current_latex, latex_ret)
-        except Exception as e:
+        except OSError as e:
+            # missing tex directory or pdflatex binary
             return (False, None, str(e))
+        if "error" in latex_ret.lower(): return (False, None, latex_ret)
+        return (True, current_latex, latex_ret)
 
     def matches_command(self, cmd_str) -> bool:
         if "```EDIT" in cmd_str: return True
@@ -152,15 +155,8 @@ class PaperEdit(Command):
 
     def parse_command(self, *args) -> tuple:
         cmd_str, latexlines = args[0], args[1]
-        success = True
-        try:
-            text = extract_prompt(cmd_str, "EDIT").split("\n")
-            if len(text) == 0: return False, (None, None, None, None)
-            lines_to_edit = text[0].split(" ")
-            if len(lines_to_edit) != 2: return False, (None, None, None, None)
-            lines_to_edit = [int(_) for _ in lines_to_edit]
-            if len(text[1:]) == 0: return False, (None, None, None, None)
-            return success, (lines_to_edit[0], lines_to_edit[1], latexlines, text[1:])
-        except Exception as e:
-            return False, (None, None, None, None)
-
+        match = EDIT_COMMAND_PATTERN.search(cmd_str)
+        if match is None: return False, (None, None, None, None)
+        new_lines = match.group(3).rstrip()
+        if not new_lines: return False, (None, None, None, None)
+        return True, (int(match.group(1)), int(match.group(2)), latexlines, new_lines.split("\n"))
@@ -9,6 +9,7 @@ from copy import deepcopy
 from common_imports import *
 from agents.base import get_score
 import os, sys
+from concurrent.futures import ThreadPoolExecutor
 
 from .commands import Arxiv, PaperReplace, PaperEdit
 from .constants import per_section_tips
@@ -43,6 +44,8 @@ class PaperSolver:
         self.paper_lines = str()
         self.prev_paper_ret = str()
         self.section_related_work = {}
+        # (command list, description) so the prompt text is only rebuilt when the commands are swapped
+        self._cmd_desc_cache = (None, str())
         self.openai_api_key = openai_api_key
 
     def solve(self):
@@ -50,14 +53,30 @@ class PaperSolver:
         best_pkg = None
         top_score = None
         self.prev_paper_ret = None
-        while True:
+        # attempts do not depend on each other, so the samples needed before the
+        #  first possible stop are requested together
+        prefetched = list()
+        for _ in range(self.min_gen_trials + 1):
             self.paper_lines = copy(random.choice(self.best_report)[0])
-            model_resp = query_model(
-                model_str=self.model,
-                system_prompt=self.system_prompt(),
-                prompt=f"\nNow please enter a command: ",
-                temp=1.0,
-                openai_api_key=self.openai_api_key)
+            prefetched.append((self.paper_lines, self.system_prompt()))
+        prefetched_resps = query_model_batch(
+            model_str=self.model,
+            prompts=[f"\nNow please enter a command: "] * len(prefetched),
+            system_prompts=[_sys for _, _sys in prefetched],
+            temp=1.0,
+            openai_api_key=self.openai_api_key)
+        while True:
+            if num_attempts < len(prefetched):
+                self.paper_lines = prefetched[num_attempts][0]
+                model_resp = prefetched_resps[num_attempts]
+            else:
+                self.paper_lines = copy(random.choice(self.best_report)[0])
+                model_resp = query_model(
+                    model_str=self.model,
+                    system_prompt=self.system_prompt(),
+                    prompt=f"\nNow please enter a command: ",
+                    temp=1.0,
+                    openai_api_key=self.openai_api_key)
             model_resp = self.clean_text(model_resp)
             cmd_str, paper_lines, prev_paper_ret, score = self.process_command(model_resp)
             if score is not None:
@@ -106,30 +125,45 @@ class PaperSolver:
         text = text.replace("```\n", "```")
         return text
 
+    def find_section_papers(self, section, arx):
+        """
+        Query arXiv for papers the given section can cite
+        @param section: (str) name of the paper section
+        @param arx: (ArxivSearch) search engine used for the query
+        @return: (str) paper summaries, empty if nothing was found
+        """
+        attempts = 0
+        papers = str()
+        first_attempt = True
+        while len(papers) == 0:
+            att_str = str()
+            if attempts > 5:
+                break
+            if not first_attempt:
+                att_str = "This is not your first attempt please try to come up with a simpler search query."
+            search_query = query_model(model_str=f"{self.llm_str}", prompt=f"Given the following research topic {self.topic} and research plan: \n\n{self.plan}\n\nPlease come up with a search query to find relevant papers on arXiv. Respond only with the search query and nothing else. This should be a a string that will be used to find papers with semantically similar content. {att_str}", system_prompt=f"You are a research paper finder. You must find papers for the section {section}. Query must be text nothing else.", openai_api_key=self.openai_api_key)
+            search_query = search_query.replace('"', '')
+            papers = arx.find_papers_by_str(query=search_query, N=10)
+            first_attempt = False
+            attempts += 1
+        return papers
+
     def gen_initial_report(self):
         num_attempts = 0
         arx = ArxivSearch()
         section_scaffold = str()
         #  1. Abstract 2. Introduction, 3. Background, 4. Methods, 5. Experimental Setup 6. Results, and 7. Discussion
-        for _section in ["scaffold", "abstract", "introduction", "related work", "background", "methods", "experimental setup", "results", "discussion"]:
-            section_complete = False
-            if _section in ["introduction", "related work", "background", "methods", "discussion"]:
-                attempts = 0
-                papers = str()
-                first_attempt = True
-                while len(papers) == 0:
-                    att_str = str()
-                    if attempts > 5:
-                        break
-                    if not first_attempt:
-                        att_str = "This is not your first attempt please try to come up with a simpler search query."
-                    search_query = query_model(model_str=f"{self.llm_str}", prompt=f"Given the following research topic {self.topic} and research plan: \n\n{self.plan}\n\nPlease come up with a search query to find relevant papers on arXiv. Respond only with the search query and nothing else. This should be a a string that will be used to find papers with semantically similar content. {att_str}", system_prompt=f"You are a research paper finder. You must find papers for the section {_section}. Query must be text nothing else.", openai_api_key=self.openai_api_key)
-                    search_query.replace('"', '')
-                    papers = arx.find_papers_by_str(query=search_query, N=10)
-                    first_attempt = False
-                    attempts += 1
+        sections = ["scaffold", "abstract", "introduction", "related work", "background", "methods", "experimental setup", "results", "discussion"]
+        # the related work searches do not depend on the sections written before them,
+        #  so gather them all up front instead of blocking each section on its search
+        search_sections = [_section for _section in sections if _section in ["introduction", "related work", "background", "methods", "discussion"]]
+        with ThreadPoolExecutor(max_workers=len(search_sections)) as executor:
+            section_papers = executor.map(lambda _section: self.find_section_papers(_section, arx), search_sections)
+            for _section, papers in zip(search_sections, section_papers):
                 if len(papers) != 0:
                     self.section_related_work[_section] = papers
+        for _section in sections:
+            section_complete = False
             while not section_complete:
                 section_scaffold_temp = copy(section_scaffold)
                 if num_attempts == 0: err = str()
@@ -207,7 +241,7 @@ class PaperSolver:
                         success = success and args[0]
                         if not success: pass
                         else:
-                            paper_lines = copy(args[1]) #
+                            paper_lines = args[1]
                             if scoring:
                                 score, cmd_str, is_valid = get_score(self.plan, "\n".join(paper_lines), reward_model_llm=self.llm_str)
                             else:
@@ -220,7 +254,6 @@ class PaperSolver:
                         if not self.supress_print: print("$$$$ PAPER EDIT (failed)")
                     else:
                         cmd_str = "Paper was successfully edited."
-                        paper_lines = copy(args[1])
                         prev_paper_ret = copy(args[2])
                         if not self.supress_print: print("$$$$ PAPER EDIT (success)")
                 elif cmd.cmd_type == "PAPER-replace": # DONE
@@ -229,7 +262,7 @@ class PaperSolver:
                     success, args = cmd.parse_command(model_resp, self.compile_pdf)
                     paper_err = f"Return from executing latex: {args[1]}"
                     if success:
-                        paper_lines = copy(args[0]) #
+                        paper_lines = args[0]
                         if scoring:
                             score, cmd_str, is_valid = get_score(self.plan, "\n".join(paper_lines), reward_model_llm=self.llm_str)
                         else:
@@ -241,7 +274,6 @@ class PaperSolver:
                         if not self.supress_print: print("$$$$ PAPER REPLACE (failed)")
                     else:
                         cmd_str = "Paper was successfully replaced."
-                        paper_lines = copy(args[0])
                         prev_paper_ret = copy(args[1])
                         if not self.supress_print: print("$$$$ PAPER REPLACE (success)")
         return cmd_str, paper_lines, prev_paper_ret, score
@@ -252,10 +284,7 @@ class PaperSolver:
         @param code: (list) list of code line strings
         @return: (str) code lines formatted with line numbers
         """
-        codestr = str()
-        for _index in range(len(code)):
-            codestr += f"{_index} |{code[_index]}\n"
-        return codestr
+        return "".join([f"{_index} |{_line}\n" for _index, _line in enumerate(code)])
 
     def system_prompt(self, commands=True, section=None):
         """
@@ -333,8 +362,12 @@ class PaperSolver:
         Provide command descriptions
         @return: (str) command descriptions
         """
+        if self._cmd_desc_cache[0] is self.commands:
+            return self._cmd_desc_cache[1]
         cmd_strings = "\n".join([_cmd.docstring() for _cmd in self.commands])
-        return f"\nYou also have access to tools which can be interacted with using the following structure: ```COMMAND\n<command information here>\n```, where COMMAND is whichever command you want to run (e.g. EDIT,...), <command information here> is information used for the command and ``` are meant to encapsulate the command. ``` must be included as part of the command both at the beginning and at the end of the command. DO NOT FORGOT TO HAVE ``` AT THE TOP AND BOTTOM OF COMMAND. and this structure must be followed to execute a command correctly. YOU CAN ONLY EXECUTE A SINGLE COMMAND AT A TIME! Do not try to perform multiple commands EVER only one." + cmd_strings
+        cmd_desc = f"\nYou also have access to tools which can be interacted with using the following structure: ```COMMAND\n<command information here>\n```, where COMMAND is whichever command you want to run (e.g. EDIT,...), <command information here> is information used for the command and ``` are meant to encapsulate the command. ``` must be included as part of the command both at the beginning and at the end of the command. DO NOT FORGOT TO HAVE ``` AT THE TOP AND BOTTOM OF COMMAND. and this structure must be followed to execute a command correctly. YOU CAN ONLY EXECUTE A SINGLE COMMAND AT A TIME! Do not try to perform multiple commands EVER only one." + cmd_strings
+        self._cmd_desc_cache = (self.commands, cmd_desc)
+        return cmd_desc
 
     def role_description(self):
         """
@@ -0,0 +1,19 @@
+import ast
+from pathlib import Path
+
+# resolved from this file so the suite runs from any working directory
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def load_functions(path, names, extra_ns=None):
+    # the modules under test import the full inference stack, so only the named top-level
+    #  functions, classes and constants are compiled, with their dependencies stubbed in extra_ns
+    tree = ast.parse((REPO_ROOT / path).read_text())
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in names:
+            body.append(node)
+        elif isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name) and node.targets[0].id in names:
+            body.append(node)
+    namespace = dict(extra_ns or {})
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, 'exec'), namespace)
+    return namespace
@@ -0,0 +1,38 @@
+import unittest
+import io
+import sys
+import time
+import types
+import queue
+import traceback
+import multiprocessing
+from _loader import load_functions
+
+@unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'the loaded worker is only reachable from a forked child')
+class ExecuteCodeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ns = load_functions('tools/common.py', {'worker_run_code', 'execute_code'},
+            {'io': io, 'sys': sys, 'time': time, 'queue': queue, 'traceback': traceback, 'multiprocessing': multiprocessing})
+
+    def setUp(self):
+        # the executed code starts with "from utils import *", the real utils needs the inference stack
+        self.utils = sys.modules.get('utils')
+        sys.modules['utils'] = types.ModuleType('utils')
+
+    def tearDown(self):
+        if self.utils is None: sys.modules.pop('utils', None)
+        else: sys.modules['utils'] = self.utils
+
+    def test_returns_output(self):
+        self.assertEqual(self.ns['execute_code']('print(1 + 1)', timeout=10), '2\n')
+
+    def test_lingering_thread_does_not_outlive_timeout(self):
+        code = 'import threading, time\nthreading.Thread(target=time.sleep, args=(30,)).start()\nprint("started")'
+        start = time.time()
+        output = self.ns['execute_code'](code, timeout=2)
+        self.assertEqual(output, 'started\n')
+        self.assertLess(time.time() - start, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from _loader import load_functions
+
+class SharedSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.built = []
+        def HFDataSearch(like_thr, dwn_thr):
+            # slow enough that every caller arrives before the first build finishes
+            time.sleep(0.2)
+            self.built.append((like_thr, dwn_thr))
+            return object()
+        self.ns = load_functions('tools/common.py', {'_hf_data_searches', '_hf_data_search_lock', 'get_hf_data_search'},
+            {'threading': threading, 'HFDataSearch': HFDataSearch})
+
+    def test_concurrent_first_use_builds_once(self):
+        get_hf_data_search = self.ns['get_hf_data_search']
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            searches = list(executor.map(lambda _: get_hf_data_search(), range(4)))
+        self.assertEqual(self.built, [(3, 50)])
+        self.assertTrue(all(search is searches[0] for search in searches))
+        self.assertIsNot(get_hf_data_search(like_thr=5), searches[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import re
+from _loader import load_functions
+
+PREAMBLE_NAMES = frozenset({'LATEX_DOCUMENTCLASS', 'LATEX_PREAMBLE', 'USEPACKAGE_PATTERN', 'LATEX_COMMENT_PATTERN', '_PREAMBLE_PACKAGES', '_inject_preamble'})
+
+class InjectPreambleTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ns = load_functions('utils/__init__.py', PREAMBLE_NAMES, {'re': re})
+
+    def test_injects_full_preamble(self):
+        latex = '\\documentclass{article}\n\\begin{document}\n\\end{document}'
+        self.assertEqual(self.ns['_inject_preamble'](latex), self.ns['LATEX_PREAMBLE'] + '\n\\begin{document}\n\\end{document}')
+
+    def test_skips_packages_the_document_loads(self):
+        latex = '\\documentclass{article}\n\\usepackage[table]{xcolor}\n\\usepackage{amsmath, graphicx}\n\\begin{document}\n\\end{document}'
+        result = self.ns['_inject_preamble'](latex)
+        for package in ['xcolor', 'amsmath', 'graphicx']:
+            self.assertNotIn('\\usepackage{%s}' % package, result)
+        self.assertIn('\\usepackage[table]{xcolor}', result)
+        self.assertIn('\\usepackage{amssymb}', result)
+        self.assertEqual(result.count('\\documentclass{article}'), 1)
+
+    def test_ignores_commented_and_body_packages(self):
+        latex = ('\\documentclass{article}\n% \\usepackage{amsmath}\n50\\% done \\usepackage{xcolor}\n'
+                 '\\begin{document}\n\\begin{verbatim}\\usepackage{graphicx}\\end{verbatim}\n\\end{document}')
+        result = self.ns['_inject_preamble'](latex)
+        for package in ['amsmath', 'graphicx']:
+            self.assertIn('\\usepackage{%s}\n' % package, result)
+        self.assertEqual(result.count('\\usepackage{xcolor}'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
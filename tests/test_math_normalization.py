@@ -0,0 +1,50 @@
+import unittest
+import re
+from _loader import load_functions
+
+NORMALIZATION_HELPERS = frozenset({'fix_fracs', 'fix_a_slash_b', 'remove_right_units', 'fix_sqrt', 'strip_string', 'is_equiv', 'last_boxed_only_string', 'BRACE_PATTERN'})
+
+class StripStringTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ns = load_functions('utils/__init__.py', NORMALIZATION_HELPERS, {'re': re})
+
+    def test_fracs(self):
+        fix_fracs = self.ns['fix_fracs']
+        self.assertEqual(fix_fracs('\\frac12'), '\\frac{1}{2}')
+        self.assertEqual(fix_fracs('\\frac1{72}'), '\\frac{1}{72}')
+        self.assertEqual(fix_fracs('x+\\frac{a}{b}'), 'x+\\frac{a}{b}')
+        self.assertEqual(fix_fracs('\\frac1'), '\\frac1')
+
+    def test_sqrt(self):
+        self.assertEqual(self.ns['fix_sqrt']('\\sqrt3+\\sqrt{2}'), '\\sqrt{3}+\\sqrt{2}')
+
+    def test_a_slash_b(self):
+        fix_a_slash_b = self.ns['fix_a_slash_b']
+        self.assertEqual(fix_a_slash_b('3/4'), '\\frac{3}{4}')
+        self.assertEqual(fix_a_slash_b('1/2/3'), '1/2/3')
+
+    def test_strip_string(self):
+        strip_string = self.ns['strip_string']
+        self.assertEqual(strip_string('k = \\dfrac12'), '\\frac{1}{2}')
+        self.assertEqual(strip_string('50\\%'), '50')
+        self.assertEqual(strip_string('\\\\\\%%sqrt'), 'sqrt')
+        self.assertEqual(strip_string('.5'), '\\frac{1}{2}')
+        self.assertEqual(strip_string('10\\text{ cm}'), '10')
+        self.assertEqual(strip_string('\\left( 1, 2 \\right)'), '(1,2)')
+
+    def test_is_equiv(self):
+        is_equiv = self.ns['is_equiv']
+        self.assertTrue(is_equiv('1/2', '\\frac{1}{2}'))
+        self.assertFalse(is_equiv('1/3', '\\frac{1}{2}'))
+
+    def test_last_boxed_only_string(self):
+        last_boxed = self.ns['last_boxed_only_string']
+        self.assertEqual(last_boxed('so \\boxed{1} and \\boxed{\\frac{1}{2}} done'), '\\boxed{\\frac{1}{2}}')
+        self.assertEqual(last_boxed('\\fbox{x}'), '\\fbox{x}')
+        self.assertEqual(last_boxed('\\boxed 5$'), '\\boxed 5')
+        self.assertIsNone(last_boxed('\\boxed{1'))
+        self.assertIsNone(last_boxed('no answer'))
+
+if __name__ == '__main__':
+    unittest.main()
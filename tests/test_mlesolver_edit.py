@@ -0,0 +1,78 @@
+import unittest
+import re
+import functools
+from _loader import load_functions
+
+# code passed to execute_code by the loaded Edit class, shared by every test
+EXECUTED = []
+
+@functools.lru_cache(maxsize=None)
+def load_edit():
+    class Command:
+        def __init__(self):
+            self.cmd_type = "OTHER"
+    def extract_prompt(text, word):
+        pattern = rf"```{word}(.*?)```"
+        blocks = re.findall(pattern, text, re.DOTALL)
+        return "\n".join(blocks).strip()
+    def execute_code(code_str):
+        EXECUTED.append(code_str)
+        return "ok"
+    namespace = load_functions('mlesolver/commands.py', {'EDIT_COMMAND_PATTERN', 'Edit'},
+        {'re': re, 'Command': Command, 'extract_prompt': extract_prompt, 'execute_code': execute_code})
+    return namespace['Edit']
+
+class EditExecuteTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executed = EXECUTED
+        cls.edit = load_edit()()
+
+    def setUp(self):
+        self.executed.clear()
+
+    def test_replaces_inclusive_range(self):
+        code = ["a", "b", "c", "d"]
+        success, new_code, _ = self.edit.execute_command((1, 2, code, ["x"], "dataset"))
+        self.assertTrue(success)
+        self.assertEqual(new_code, ["a", "x", "d"])
+        self.assertEqual(self.executed, ["dataset\na\nx\nd"])
+
+    def test_can_grow_code(self):
+        code = ["a", "b", "c"]
+        success, new_code, _ = self.edit.execute_command((0, 0, code, ["x", "y", "z"], ""))
+        self.assertTrue(success)
+        self.assertEqual(new_code, ["x", "y", "z", "b", "c"])
+
+    def test_rejects_out_of_range_lines(self):
+        code = ["a", "b", "c"]
+        for first, last in [(1, 3), (2, 1), (-1, 0)]:
+            success, new_code, _ = self.edit.execute_command((first, last, code, ["x"], ""))
+            self.assertFalse(success)
+            self.assertIsNone(new_code)
+        self.assertEqual(code, ["a", "b", "c"])
+        self.assertEqual(self.executed, [])
+
+class EditParseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.edit = load_edit()()
+
+    def test_parses_header_and_body(self):
+        success, args = self.edit.parse_command('```EDIT 2 4\n    x = 1\ny = 2\n```', ["code"], "dataset")
+        self.assertTrue(success)
+        self.assertEqual(args, (2, 4, ["code"], ["    x = 1", "y = 2"], "dataset"))
+
+    def test_rejects_malformed_header(self):
+        for cmd in ['```EDIT 2\nx\n```', '```EDIT a b\nx\n```', '```EDIT 1 2 3\nx\n```', '```EDIT -1 2\nx\n```']:
+            success, args = self.edit.parse_command(cmd, [], "")
+            self.assertFalse(success)
+            self.assertIsNone(args)
+
+    def test_rejects_empty_body(self):
+        success, args = self.edit.parse_command('```EDIT 0 1\n```', [], "")
+        self.assertFalse(success)
+        self.assertIsNone(args)
+
+if __name__ == '__main__':
+    unittest.main()
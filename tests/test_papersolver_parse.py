@@ -1,15 +1,12 @@
 import unittest
 import re
-from pathlib import Path
+from _loader import load_functions
 
 class EmptyStr:
     def split(self, sep=None):
         return []
 
 def load_arxiv():
-    source = Path('papersolver/commands.py').read_text()
-    match = re.search(r'class Arxiv\(Command\):(.*?)(?=class PaperReplace)', source, re.S)
-    code = match.group(0)
     class Command:
         pass
     def extract_prompt(text, word):
@@ -18,14 +15,15 @@ def load_arxiv():
         if not blocks:
             return EmptyStr()
         return "\n".join(blocks).strip()
-    namespace = {'Command': Command, 'extract_prompt': extract_prompt, 'EmptyStr': EmptyStr}
-    exec(code, namespace)
+    namespace = load_functions('papersolver/commands.py', {'Arxiv'},
+        {'Command': Command, 'extract_prompt': extract_prompt, 'EmptyStr': EmptyStr})
     return namespace['Arxiv']
 
 class ParseCommandTest(unittest.TestCase):
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         Arxiv = load_arxiv()
-        self.arxiv = Arxiv.__new__(Arxiv)
+        cls.arxiv = Arxiv.__new__(Arxiv)
 
     def test_summary(self):
         success, data = self.arxiv.parse_command('```SUMMARY\nquery\n```')
@@ -1,8 +1,9 @@
-from .common import HFDataSearch, SemanticScholarSearch, ArxivSearch, execute_code
+from .common import HFDataSearch, SemanticScholarSearch, ArxivSearch, execute_code, get_hf_data_search
 
 __all__ = [
     'HFDataSearch',
     'SemanticScholarSearch',
     'ArxivSearch',
     'execute_code',
+    'get_hf_data_search',
 ]
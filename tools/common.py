@@ -2,12 +2,16 @@ from utils import *
 
 import os
 import time
+import queue
 import arxiv
+import requests
 import io, sys
+import threading
 import traceback
 import matplotlib
 import numpy as np
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from pypdf import PdfReader
 from datasets import load_dataset
 from psutil._common import bytes2human
@@ -19,6 +23,10 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 
 
 class HFDataSearch:
+    # dataset id -> split availability and sizes, each lookup loads the dataset builder from the hub
+    split_info_cache = dict()
+    max_parallel_lookups = 8
+
     def __init__(self, like_thr=3, dwn_thr=50) -> None:
         """
         Class for finding relevant huggingface datasets
@@ -29,28 +37,16 @@ class HFDataSearch:
         self.like_thr = like_thr
         self.ds = load_dataset("nkasmanoff/huggingface-datasets")["train"]
 
-        # Initialize lists to collect filtered data
-        filtered_indices = []
-        filtered_descriptions = []
-        filtered_likes = []
-        filtered_downloads = []
-
-        # Iterate over the dataset and filter based on criteria
-        for idx, item in enumerate(self.ds):
-            # Get likes and downloads, handling None values
-            likes = int(item['likes']) if item['likes'] is not None else 0
-            downloads = int(item['downloads']) if item['downloads'] is not None else 0
-
-            # Check if likes and downloads meet the thresholds
-            if likes >= self.like_thr and downloads >= self.dwn_thr:
-                # Check if the description is a non-empty string
-                description = item['description']
-                if isinstance(description, str) and description.strip():
-                    # Collect the data
-                    filtered_indices.append(idx)
-                    filtered_descriptions.append(description)
-                    filtered_likes.append(likes)
-                    filtered_downloads.append(downloads)
+        # Read the needed columns once instead of decoding every row, handling None values
+        likes = np.array([int(v) if v is not None else 0 for v in self.ds['likes']], dtype=np.int64)
+        downloads = np.array([int(v) if v is not None else 0 for v in self.ds['downloads']], dtype=np.int64)
+        descriptions = self.ds['description']
+
+        # Check likes and downloads against the thresholds for all datasets at once,
+        # then keep only those whose description is a non-empty string
+        candidates = np.flatnonzero((likes >= self.like_thr) & (downloads >= self.dwn_thr))
+        filtered_indices = [int(idx) for idx in candidates
+            if isinstance(descriptions[idx], str) and descriptions[idx].strip()]
 
         # Check if any datasets meet all criteria
         if not filtered_indices:
@@ -66,9 +62,9 @@ class HFDataSearch:
         self.ds = self.ds.select(filtered_indices)
 
         # Update descriptions, likes, and downloads
-        self.descriptions = filtered_descriptions
-        self.likes = np.array(filtered_likes)
-        self.downloads = np.array(filtered_downloads)
+        self.descriptions = [descriptions[idx] for idx in filtered_indices]
+        self.likes = likes[filtered_indices]
+        self.downloads = downloads[filtered_indices]
 
         # Normalize likes and downloads
         self.likes_norm = self._normalize(self.likes)
@@ -109,33 +105,48 @@ class HFDataSearch:
                 like_w * self.likes_norm +
                 dwn_w * self.downloads_norm
         )
-        # Get top N indices
-        top_indices = final_scores.argsort()[-N:][::-1]
+        # Get top N indices, only the N best need to be ordered rather than the whole catalogue
+        if 0 < N < len(final_scores):
+            top_indices = np.argpartition(final_scores, -N)[-N:]
+            top_indices = top_indices[final_scores[top_indices].argsort()][::-1]
+        else:
+            top_indices = final_scores.argsort()[-N:][::-1]
         # Convert indices to Python ints
         top_indices = [int(i) for i in top_indices]
         top_datasets = [self.ds[i] for i in top_indices]
-        # check if dataset has a test & train set
-        has_test_set = list()
-        has_train_set = list()
-        ds_size_info = list()
-        for i in top_indices:
-            try:
-                dbuilder = load_dataset_builder(self.ds[i]["id"], trust_remote_code=True).info
-            except Exception as e:
-                has_test_set.append(False)
-                has_train_set.append(False)
-                ds_size_info.append((None, None, None, None))
-                continue
-
-            if dbuilder.splits is None:
-                has_test_set.append(False)
-                has_train_set.append(False)
-                ds_size_info.append((None, None, None, None))
-                continue
-            # Print number of examples for
+        # check if dataset has a test & train set, each lookup is an independent hub request
+        if top_datasets:
+            with ThreadPoolExecutor(max_workers=min(len(top_datasets), self.max_parallel_lookups)) as executor:
+                split_infos = list(executor.map(self._split_info, [dataset["id"] for dataset in top_datasets]))
+        else:
+            split_infos = list()
+        for dataset, (has_test, has_train, ds_size_info) in zip(top_datasets, split_infos):
+            dataset["has_test_set"] = has_test
+            dataset["has_train_set"] = has_train
+            dataset["test_download_size"] = ds_size_info[0]
+            dataset["test_element_size"] = ds_size_info[1]
+            dataset["train_download_size"] = ds_size_info[2]
+            dataset["train_element_size"] = ds_size_info[3]
+        return top_datasets
+
+    def _split_info(self, ds_id):
+        """
+        Look up which splits a dataset has and how large they are.
+        :param ds_id: Hugging Face dataset id.
+        :return: (has_test, has_train, (test_download_size, test_element_size, train_download_size, train_element_size))
+        """
+        if ds_id in HFDataSearch.split_info_cache:
+            return HFDataSearch.split_info_cache[ds_id]
+        try:
+            dbuilder = load_dataset_builder(ds_id, trust_remote_code=True).info
+        except Exception as e:
+            # not cached, the hub may only be temporarily unreachable
+            return False, False, (None, None, None, None)
+
+        if dbuilder.splits is None:
+            split_info = (False, False, (None, None, None, None))
+        else:
             has_test, has_train = "test" in dbuilder.splits, "train" in dbuilder.splits
-            has_test_set.append(has_test)
-            has_train_set.append(has_train)
             test_dwn_size, test_elem_size = None, None
             train_dwn_size, train_elem_size = None, None
             if has_test:
@@ -144,15 +155,9 @@ class HFDataSearch:
             if has_train:
                 train_dwn_size = bytes2human(dbuilder.splits["train"].num_bytes)
                 train_elem_size = dbuilder.splits["train"].num_examples
-            ds_size_info.append((test_dwn_size, test_elem_size, train_dwn_size, train_elem_size))
-        for _i in range(len(top_datasets)):
-            top_datasets[_i]["has_test_set"] = has_test_set[_i]
-            top_datasets[_i]["has_train_set"] = has_train_set[_i]
-            top_datasets[_i]["test_download_size"] = ds_size_info[_i][0]
-            top_datasets[_i]["test_element_size"] = ds_size_info[_i][1]
-            top_datasets[_i]["train_download_size"] = ds_size_info[_i][2]
-            top_datasets[_i]["train_element_size"] = ds_size_info[_i][3]
-        return top_datasets
+            split_info = (has_test, has_train, (test_dwn_size, test_elem_size, train_dwn_size, train_elem_size))
+        HFDataSearch.split_info_cache[ds_id] = split_info
+        return split_info
 
     def results_str(self, results):
         """
@@ -176,11 +181,40 @@ class HFDataSearch:
         return result_strs
 
 
+# (like_thr, dwn_thr) -> HFDataSearch, built once and shared by all labs
+_hf_data_searches = dict()
+_hf_data_search_lock = threading.Lock()
+
+
+def get_hf_data_search(like_thr=3, dwn_thr=50):
+    """
+    Shared HFDataSearch per threshold setting, the index downloads and vectorizes the whole catalogue
+    :param like_thr: minimum number of likes
+    :param dwn_thr: minimum number of downloads
+    :return: (HFDataSearch) search engine
+    """
+    key = (like_thr, dwn_thr)
+    search = _hf_data_searches.get(key)
+    if search is None:
+        # parallel labs reach their first dataset search together, only one of them builds the index
+        with _hf_data_search_lock:
+            search = _hf_data_searches.get(key)
+            if search is None:
+                search = _hf_data_searches[key] = HFDataSearch(like_thr=like_thr, dwn_thr=dwn_thr)
+    return search
+
+
 class SemanticScholarSearch:
+    # (normalized query, N) -> paper summaries, literature queries are often re-issued across phases
+    search_cache = dict()
+
     def __init__(self):
         self.sch_engine = SemanticScholar(retry=False)
 
     def find_papers_by_str(self, query, N=10):
+        cache_key = (query.strip().lower(), N)
+        if cache_key in SemanticScholarSearch.search_cache:
+            return SemanticScholarSearch.search_cache[cache_key]
         paper_sums = list()
         results = self.sch_engine.search_paper(query, limit=N, min_citation_count=3, open_access_pdf=True)
         for _i in range(len(results)):
@@ -191,6 +225,7 @@ class SemanticScholarSearch:
             paper_sum += f'Venue: {results[_i].venue}\n'
             paper_sum += f'Paper ID: {results[_i].externalIds["DOI"]}\n'
             paper_sums.append(paper_sum)
+        SemanticScholarSearch.search_cache[cache_key] = paper_sums
         return paper_sums
 
     def retrieve_full_paper_text(self, query):
@@ -198,6 +233,15 @@ class SemanticScholarSearch:
 
 
 class ArxivSearch:
+    # arXiv asks clients to space out their API requests, searches issued
+    #  from several threads are serialized on this lock
+    request_lock = threading.Lock()
+    # arXiv id -> extracted full text, shared so that a paper read with FULL_TEXT
+    #  and then added to the review (or read again in a later phase) is fetched once
+    full_text_cache = dict()
+    # (normalized query, N) -> formatted search results, failed searches are not cached
+    search_cache = dict()
+
     def __init__(self):
         # Construct the default API client.
         self.sch_engine = arxiv.Client()
@@ -209,24 +253,17 @@ class ArxivSearch:
         if len(query) <= MAX_QUERY_LENGTH:
             return query
         
-        # Split into words
-        words = query.split()
-        processed_query = []
-        current_length = 0
-        
-        # Add words while staying under the limit
-        # Account for spaces between words
-        for word in words:
-            # +1 for the space that will be added between words
-            if current_length + len(word) + 1 <= MAX_QUERY_LENGTH:
-                processed_query.append(word)
-                current_length += len(word) + 1
-            else:
-                break
-            
-        return ' '.join(processed_query)
+        # Collapse whitespace, then cut at the last word boundary that leaves room for a trailing space
+        processed_query = " ".join(query.split())
+        if len(processed_query) < MAX_QUERY_LENGTH:
+            return processed_query
+        cut = processed_query.rfind(" ", 0, MAX_QUERY_LENGTH)
+        return processed_query[:cut] if cut != -1 else ""
     
     def find_papers_by_str(self, query, N=20):
+        cache_key = (query.strip().lower(), N)
+        if cache_key in ArxivSearch.search_cache:
+            return ArxivSearch.search_cache[cache_key]
         processed_query = self._process_query(query)
         max_retries = 3
         retry_count = 0
@@ -239,18 +276,21 @@ class ArxivSearch:
                     sort_by=arxiv.SortCriterion.Relevance)
 
                 paper_sums = list()
-                # `results` is a generator; you can iterate over its elements one by one...
-                for r in self.sch_engine.results(search):
-                    paperid = r.pdf_url.split("/")[-1]
-                    pubdate = str(r.published).split(" ")[0]
-                    paper_sum = f"Title: {r.title}\n"
-                    paper_sum += f"Summary: {r.summary}\n"
-                    paper_sum += f"Publication Date: {pubdate}\n"
-                    #paper_sum += f"Categories: {' '.join(r.categories)}\n"
-                    paper_sum += f"arXiv paper ID: {paperid}\n"
-                    paper_sums.append(paper_sum)
-                time.sleep(2.0)
-                return "\n".join(paper_sums)
+                with ArxivSearch.request_lock:
+                    # `results` is a generator; you can iterate over its elements one by one...
+                    for r in self.sch_engine.results(search):
+                        paperid = r.pdf_url.split("/")[-1]
+                        pubdate = str(r.published).split(" ")[0]
+                        paper_sum = f"Title: {r.title}\n"
+                        paper_sum += f"Summary: {r.summary}\n"
+                        paper_sum += f"Publication Date: {pubdate}\n"
+                        #paper_sum += f"Categories: {' '.join(r.categories)}\n"
+                        paper_sum += f"arXiv paper ID: {paperid}\n"
+                        paper_sums.append(paper_sum)
+                    time.sleep(2.0)
+                paper_sums = "\n".join(paper_sums)
+                ArxivSearch.search_cache[cache_key] = paper_sums
+                return paper_sums
                 
             except Exception as e:
                 retry_count += 1
@@ -260,27 +300,29 @@ class ArxivSearch:
         return None
 
     def retrieve_full_paper_text(self, query, MAX_LEN=50000):
-        pdf_text = str()
+        paper_id = query.strip()
+        if paper_id in ArxivSearch.full_text_cache:
+            return ArxivSearch.full_text_cache[paper_id][:MAX_LEN]
+        pdf_text = list()
         paper = next(arxiv.Client().results(arxiv.Search(id_list=[query])))
-        # Download the PDF to the PWD with a custom filename.
-        paper.download_pdf(filename="downloaded-paper.pdf")
+        # Read the PDF from memory, a fixed file in the PWD is clobbered by labs running in parallel
+        response = requests.get(paper.pdf_url, timeout=60)
+        response.raise_for_status()
         # creating a pdf reader object
-        reader = PdfReader('downloaded-paper.pdf')
+        reader = PdfReader(io.BytesIO(response.content))
         # Iterate over all the pages
         for page_number, page in enumerate(reader.pages, start=1):
             # Extract text from the page
             try:
                 text = page.extract_text()
             except Exception as e:
-                os.remove("downloaded-paper.pdf")
                 time.sleep(2.0)
                 return "EXTRACTION FAILED"
 
             # Do something with the text (e.g., print it)
-            pdf_text += f"--- Page {page_number} ---"
-            pdf_text += text
-            pdf_text += "\n"
-        os.remove("downloaded-paper.pdf")
+            pdf_text.append(f"--- Page {page_number} ---{text}\n")
+        pdf_text = "".join(pdf_text)
+        ArxivSearch.full_text_cache[paper_id] = pdf_text
         time.sleep(2.0)
         return pdf_text[:MAX_LEN]
 
@@ -313,13 +355,27 @@ def execute_code(code_str, timeout=600, MAX_LEN=1000):
     output_queue = multiprocessing.Queue()
     proc = multiprocessing.Process(target=worker_run_code, args=(code_str, output_queue))
     proc.start()
-    proc.join(timeout)
-    if proc.is_alive():
+    # read the output before joining, a child whose output does not fit in the pipe
+    #  cannot exit until it is drained and would otherwise block until the timeout
+    deadline = time.time() + timeout
+    output = None
+    while output is None:
+        try:
+            output = output_queue.get(timeout=min(1.0, max(deadline - time.time(), 0.01)))
+        except queue.Empty:
+            if time.time() >= deadline: break
+            if not proc.is_alive():
+                # the child may have exited right after writing its output
+                try: output = output_queue.get(timeout=0.1)
+                except queue.Empty: output = ""
+    if output is None:
         proc.terminate()  # Forcefully kill the process
         proc.join()
         return (f"[CODE EXECUTION ERROR]: Code execution exceeded the timeout limit of {timeout} seconds. "
                 "You must reduce the time complexity of your code.")
-    else:
-        if not output_queue.empty(): output = output_queue.get()
-        else: output = ""
-        return output
+    # a thread or child process the code left running must not hold the solver past the timeout
+    proc.join(max(deadline - time.time(), 0))
+    if proc.is_alive():
+        proc.terminate()
+        proc.join()
+    return output
@@ -1,16 +1,21 @@
 import os, re
+import functools
 import shutil
+from pathlib import Path
 import time
 import tiktoken, openai
-import subprocess, string
+import subprocess, string, tempfile
+import threading, signal
+from collections import deque
 from openai import OpenAI
+from inference import get_openai_client
 import google.generativeai as genai
 from huggingface_hub import InferenceClient
 
 
 def query_deepseekv3(prompt, system, api_key, attempt=0, temperature=0.0):
     try:
-        client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+        client = get_openai_client(api_key, "https://api.deepseek.com")
         response = client.chat.completions.create(
             model="deepseek-chat",
             messages=[
@@ -62,7 +67,7 @@ def query_gpt4omini(prompt, system, api_key, attempt=0, temperature=0.0):
         else:
             messages = [
                 {"role": "user", "content": prompt}]
-        client = OpenAI()
+        client = get_openai_client(api_key)
         response = client.chat.completions.create(
             model="gpt-4o-mini", messages=messages, temperature=temperature).choices[0].message.content.strip()
         return response
@@ -84,7 +89,7 @@ def query_gpt4o(prompt, system, api_key, attempt=0, temperature=0.0):
         else:
             messages = [
                 {"role": "user", "content": prompt}]
-        client = OpenAI()
+        client = get_openai_client(api_key)
         response = client.chat.completions.create(
             model="gpt-4o", messages=messages, temperature=temperature).choices[0].message.content.strip()
         return response
@@ -124,40 +129,114 @@ def query_gemini2p0(prompt, system, api_key, attempt=0, temperature=0.0,):
         return query_gemini2p0(prompt, system, attempt+1)
 
 
+# packages injected after \documentclass so that model-written latex compiles with the usual commands
+LATEX_DOCUMENTCLASS = r"\documentclass{article}"
+LATEX_PREAMBLE = "\\documentclass{article}\n\\usepackage{amsmath}\n\\usepackage{amssymb}\n\\usepackage{array}\n\\usepackage{algorithm}\n\\usepackage{algorithmicx}\n\\usepackage{algpseudocode}\n\\usepackage{booktabs}\n\\usepackage{colortbl}\n\\usepackage{color}\n\\usepackage{enumitem}\n\\usepackage{fontawesome5}\n\\usepackage{float}\n\\usepackage{graphicx}\n\\usepackage{hyperref}\n\\usepackage{listings}\n\\usepackage{makecell}\n\\usepackage{multicol}\n\\usepackage{multirow}\n\\usepackage{pgffor}\n\\usepackage{pifont}\n\\usepackage{soul}\n\\usepackage{sidecap}\n\\usepackage{subcaption}\n\\usepackage{titletoc}\n\\usepackage[symbol]{footmisc}\n\\usepackage{url}\n\\usepackage{wrapfig}\n\\usepackage{xcolor}\n\\usepackage{xspace}"
+USEPACKAGE_PATTERN = re.compile(r"\\usepackage\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}")
+# a % comment up to the end of the line, an escaped \% is a literal percent sign
+LATEX_COMMENT_PATTERN = re.compile(r"(?<!\\)%.*")
+# package name -> its preamble line, so packages the document loads itself can be left out
+_PREAMBLE_PACKAGES = {USEPACKAGE_PATTERN.match(line).group(1): line for line in LATEX_PREAMBLE.split("\n")[1:]}
+
+
+def _inject_preamble(latex_code):
+    """Add the preamble packages the document does not load itself, reloading one with other options is an error."""
+    # packages are only loaded in the preamble, commented out lines do not load anything
+    preamble_code = LATEX_COMMENT_PATTERN.sub("", latex_code.split("\\begin{document}", 1)[0])
+    loaded = {name.strip() for names in USEPACKAGE_PATTERN.findall(preamble_code) for name in names.split(",")}
+    if not loaded & _PREAMBLE_PACKAGES.keys():
+        return latex_code.replace(LATEX_DOCUMENTCLASS, LATEX_PREAMBLE, 1)
+    preamble = "\n".join([LATEX_DOCUMENTCLASS] + [line for name, line in _PREAMBLE_PACKAGES.items() if name not in loaded])
+    return latex_code.replace(LATEX_DOCUMENTCLASS, preamble, 1)
+
+
+# lines of pdflatex output kept by compile_latex
+LATEX_LOG_TAIL_LINES = 200
+
+# directories compile_latex has already created, so repeated compiles skip the check
+_ENSURED_DIRS = set()
+
+
+def _ensure_dir(dir_path):
+    if dir_path not in _ENSURED_DIRS:
+        os.makedirs(dir_path, exist_ok=True)
+        _ENSURED_DIRS.add(dir_path)
+
+
 def compile_latex(latex_code, output_path, compile=True, timeout=30):
-    latex_code = latex_code.replace(
-        r"\documentclass{article}",
-        "\\documentclass{article}\n\\usepackage{amsmath}\n\\usepackage{amssymb}\n\\usepackage{array}\n\\usepackage{algorithm}\n\\usepackage{algorithmicx}\n\\usepackage{algpseudocode}\n\\usepackage{booktabs}\n\\usepackage{colortbl}\n\\usepackage{color}\n\\usepackage{enumitem}\n\\usepackage{fontawesome5}\n\\usepackage{float}\n\\usepackage{graphicx}\n\\usepackage{hyperref}\n\\usepackage{listings}\n\\usepackage{makecell}\n\\usepackage{multicol}\n\\usepackage{multirow}\n\\usepackage{pgffor}\n\\usepackage{pifont}\n\\usepackage{soul}\n\\usepackage{sidecap}\n\\usepackage{subcaption}\n\\usepackage{titletoc}\n\\usepackage[symbol]{footmisc}\n\\usepackage{url}\n\\usepackage{wrapfig}\n\\usepackage{xcolor}\n\\usepackage{xspace}")
+    # encoded once for both copies, pdflatex reads utf-8 whatever the locale of this process
+    latex_bytes = _inject_preamble(latex_code).encode("utf-8")
     #print(latex_code)
     dir_path = f"{output_path}/tex"
     tex_file_path = os.path.join(dir_path, "temp.tex")
     # Write the LaTeX code to the .tex file in the specified directory
-    with open(tex_file_path, "w") as f:
-        f.write(latex_code)
+    _ensure_dir(dir_path)
+    try:
+        f = open(tex_file_path, "wb")
+    except FileNotFoundError:
+        # the directory was removed since it was first created
+        _ENSURED_DIRS.discard(dir_path)
+        _ensure_dir(dir_path)
+        f = open(tex_file_path, "wb")
+    with f:
+        f.write(latex_bytes)
 
     if not compile:
         return f"Compilation successful"
 
-    # Compiling the LaTeX code using pdflatex with non-interactive mode and timeout
-    try:
-        result = subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", "temp.tex"],
-            check=True,                   # Raises a CalledProcessError on non-zero exit codes
-            stdout=subprocess.PIPE,        # Capture standard output
-            stderr=subprocess.PIPE,        # Capture standard error
-            timeout=timeout,               # Timeout for the process
-            cwd=dir_path
-        )
+    # each compile runs in its own scratch directory, so concurrent compiles into the same lab
+    # never share aux files and a failed compile never overwrites the last good pdf
+    with tempfile.TemporaryDirectory(prefix="texcompile_", dir=dir_path) as work_dir:
+        with open(os.path.join(work_dir, "temp.tex"), "wb") as f:
+            f.write(latex_bytes)
+        return _run_pdflatex(work_dir, dir_path, timeout)
 
-        # If compilation is successful, return the success message
-        return f"Compilation successful: {result.stdout.decode('utf-8')}"
 
-    except subprocess.TimeoutExpired:
+def _run_pdflatex(work_dir, dir_path, timeout):
+    # Compiling the LaTeX code using pdflatex with non-interactive mode and timeout
+    proc = subprocess.Popen(
+        # stop at the first error, the edit is rejected either way and the rest of the run is wasted
+        ["pdflatex", "-interaction=nonstopmode", "-halt-on-error", "temp.tex"],
+        stdout=subprocess.PIPE,        # Capture standard output
+        stderr=subprocess.STDOUT,      # ... interleaved with standard error
+        text=True, errors="replace",   # pdflatex echoes input bytes that need not be valid utf-8
+        cwd=work_dir,
+        start_new_session=hasattr(os, "killpg")
+    )
+    timed_out = threading.Event()
+    def _kill():
+        if proc.poll() is not None: return
+        timed_out.set()
+        # font generation helpers spawned by pdflatex hold the pipe open too, kill the whole group
+        try:
+            if hasattr(os, "killpg"): os.killpg(proc.pid, signal.SIGKILL)
+            else: proc.kill()
+        except ProcessLookupError:
+            pass
+    timer = threading.Timer(timeout, _kill)
+    timer.start()
+    # only the end of the log is kept, the whole log of a long paper can be megabytes
+    log_tail = deque(maxlen=LATEX_LOG_TAIL_LINES)
+    try:
+        for line in proc.stdout:
+            log_tail.append(line)
+        returncode = proc.wait()
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+
+    if timed_out.is_set():
         # If the compilation takes too long, return a timeout message
         return "[CODE EXECUTION ERROR]: Compilation timed out after {} seconds".format(timeout)
-    except subprocess.CalledProcessError as e:
+    if returncode != 0:
         # If there is an error during LaTeX compilation, return the error message
         return f"[CODE EXECUTION ERROR]: Compilation failed. There was an error in your latex."
+    try:
+        os.replace(os.path.join(work_dir, "temp.pdf"), os.path.join(dir_path, "temp.pdf"))
+    except FileNotFoundError:
+        pass  # a document without pages produces no pdf
+    # If compilation is successful, return the success message
+    return f"Compilation successful: {''.join(log_tail)}"
 
 
 def count_tokens(messages, model="gpt-4"):
@@ -185,10 +264,9 @@ def remove_directory(dir_path):
 
 def save_to_file(location, filename, data):
     """Utility function to save data as plain text."""
-    filepath = os.path.join(location, filename)
+    filepath = Path(location, filename)
     try:
-        with open(filepath, 'w') as f:
-            f.write(data)  # Write the raw string instead of using json.dump
+        filepath.write_text(data)  # Write the raw string instead of using json.dump
         print(f"Data successfully saved to {filepath}")
     except Exception as e:
         print(f"Error saving file {filename}: {e}")
@@ -232,9 +310,13 @@ def clip_tokens(messages, model="gpt-4", max_tokens=100000):
 
 
 
+@functools.lru_cache(maxsize=None)
+def _code_block_pattern(word):
+    return re.compile(rf"```{word}(.*?)```", re.DOTALL)
+
+
 def extract_prompt(text, word):
-    code_block_pattern = rf"```{word}(.*?)```"
-    code_blocks = re.findall(code_block_pattern, text, re.DOTALL)
+    code_blocks = _code_block_pattern(word).findall(text)
     extracted_code = "\n".join(code_blocks).strip()
     return extracted_code
 
@@ -257,11 +339,12 @@ def process_docs(dataset: datasets.Dataset) -> datasets.Dataset:
 
 def process_results(doc: dict, results: List[str]) -> Dict[str, int]:
     retval = 0
-    indices = [pos for pos, char in enumerate(results[0]) if char == "$"]
-    if len(indices) <= 1:
+    # answer between the first and the last dollar sign, the whole result without at least two
+    first_dollar, last_dollar = results[0].find("$"), results[0].rfind("$")
+    if first_dollar == last_dollar:
         answer = results[0]
     else:
-        answer = results[0][indices[0] + 1 : indices[-1]]
+        answer = results[0][first_dollar + 1 : last_dollar]
 
     if is_equiv(answer, remove_boxed(last_boxed_only_string(doc["solution"]))):
         retval = 1
@@ -309,6 +392,9 @@ def remove_boxed(s):
     return clean_answer(s[len(left) : -1])
 
 
+BRACE_PATTERN = re.compile(r"[{}]")
+
+
 def last_boxed_only_string(string):
     idx = string.rfind("\\boxed")
     if "\\boxed " in string:
@@ -318,18 +404,17 @@ def last_boxed_only_string(string):
         if idx < 0:
             return None
 
-    i = idx
+    # jump from brace to brace instead of stepping through every character
     right_brace_idx = None
     num_left_braces_open = 0
-    while i < len(string):
-        if string[i] == "{":
+    for brace in BRACE_PATTERN.finditer(string, idx):
+        if brace.group() == "{":
             num_left_braces_open += 1
-        if string[i] == "}":
+        else:
             num_left_braces_open -= 1
             if num_left_braces_open == 0:
-                right_brace_idx = i
+                right_brace_idx = brace.start()
                 break
-        i += 1
 
     if right_brace_idx is None:
         retval = None
@@ -341,41 +426,28 @@ def last_boxed_only_string(string):
 
 def fix_fracs(string):
     substrs = string.split("\\frac")
-    new_str = substrs[0]
-    if len(substrs) > 1:
-        substrs = substrs[1:]
-        for substr in substrs:
-            new_str += "\\frac"
-            if substr[0] == "{":
-                new_str += substr
+    new_str = [substrs[0]]
+    for substr in substrs[1:]:
+        new_str.append("\\frac")
+        if substr[0] == "{":
+            new_str.append(substr)
+        else:
+            if len(substr) < 2:
+                return string
+            a = substr[0]
+            b = substr[1]
+            if b != "{":
+                new_str.append("{" + a + "}{" + b + "}" + substr[2:])
             else:
-                try:
-                    assert len(substr) >= 2
-                except AssertionError:
-                    return string
-                a = substr[0]
-                b = substr[1]
-                if b != "{":
-                    if len(substr) > 2:
-                        post_substr = substr[2:]
-                        new_str += "{" + a + "}{" + b + "}" + post_substr
-                    else:
-                        new_str += "{" + a + "}{" + b + "}"
-                else:
-                    if len(substr) > 2:
-                        post_substr = substr[2:]
-                        new_str += "{" + a + "}" + b + post_substr
-                    else:
-                        new_str += "{" + a + "}" + b
-    string = new_str
-    return string
+                new_str.append("{" + a + "}" + b + substr[2:])
+    return "".join(new_str)
 
 
 def fix_a_slash_b(string):
-    if len(string.split("/")) != 2:
+    parts = string.split("/")
+    if len(parts) != 2:
         return string
-    a = string.split("/")[0]
-    b = string.split("/")[1]
+    a, b = parts
     try:
         a = int(a)
         b = int(b)
@@ -400,48 +472,52 @@ def fix_sqrt(string):
     if "\\sqrt" not in string:
         return string
     splits = string.split("\\sqrt")
-    new_string = splits[0]
+    new_string = [splits[0]]
     for split in splits[1:]:
         if split[0] != "{":
             a = split[0]
-            new_substr = "\\sqrt{" + a + "}" + split[1:]
+            new_string.append("\\sqrt{" + a + "}" + split[1:])
         else:
-            new_substr = "\\sqrt" + split
-        new_string += new_substr
-    return new_string
+            new_string.append("\\sqrt" + split)
+    return "".join(new_string)
 
 
 def strip_string(string):
     # linebreaks
     string = string.replace("\n", "")
 
-    # remove inverse spaces
-    string = string.replace("\\!", "")
+    # most answers are plain numbers, every latex clean-up below needs a backslash to match anything
+    has_latex = "\\" in string
+
+    if has_latex:
+        # remove inverse spaces
+        string = string.replace("\\!", "")
 
-    # replace \\ with \
-    string = string.replace("\\\\", "\\")
+        # replace \\ with \
+        string = string.replace("\\\\", "\\")
 
     # replace tfrac and dfrac with frac
     string = string.replace("tfrac", "frac")
     string = string.replace("dfrac", "frac")
 
-    # remove \left and \right
-    string = string.replace("\\left", "")
-    string = string.replace("\\right", "")
+    if has_latex:
+        # remove \left and \right
+        string = string.replace("\\left", "")
+        string = string.replace("\\right", "")
 
-    # Remove circ (degrees)
-    string = string.replace("^{\\circ}", "")
-    string = string.replace("^\\circ", "")
+        # Remove circ (degrees)
+        string = string.replace("^{\\circ}", "")
+        string = string.replace("^\\circ", "")
 
-    # remove dollar signs
-    string = string.replace("\\$", "")
+        # remove dollar signs
+        string = string.replace("\\$", "")
 
-    # remove units (on the right)
-    string = remove_right_units(string)
+        # remove units (on the right)
+        string = remove_right_units(string)
 
-    # remove percentage
-    string = string.replace("\\%", "")
-    string = string.replace("\%", "")  # noqa: W605
+        # remove percentage, twice since removing one "\%" can join a backslash and a percent sign into another
+        string = string.replace("\\%", "")
+        string = string.replace("\\%", "")
 
     # " 0." equivalent to " ." and "{0." equivalent to "{." Alternatively, add "0" if "." is the start of the string
     string = string.replace(" .", " 0.")
@@ -453,18 +529,20 @@ def strip_string(string):
         string = "0" + string
 
     # to consider: get rid of e.g. "k = " or "q = " at beginning
-    if len(string.split("=")) == 2:
-        if len(string.split("=")[0]) <= 2:
-            string = string.split("=")[1]
+    parts = string.split("=")
+    if len(parts) == 2 and len(parts[0]) <= 2:
+        string = parts[1]
 
     # fix sqrt3 --> sqrt{3}
-    string = fix_sqrt(string)
+    if has_latex:
+        string = fix_sqrt(string)
 
     # remove spaces
     string = string.replace(" ", "")
 
     # \frac1b or \frac12 --> \frac{1}{b} and \frac{1}{2}, etc. Even works with \frac1{72} (but not \frac{72}1). Also does a/b --> \\frac{a}{b}
-    string = fix_fracs(string)
+    if has_latex:
+        string = fix_fracs(string)
 
     # manually change 0.5 --> \frac{1}{2}
     if string == "0.5":